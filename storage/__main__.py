@@ -1,23 +1,33 @@
 import argparse
 import asyncio
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi_pagination import add_pagination
 from psycopg2.errors import DuplicateSchema
+from sqlalchemy import exc
 from sqlalchemy.exc import ProgrammingError
 from tenacity import retry, stop_after_attempt, wait_fixed
 from uvicorn import Config, Server
 
 from storage import __version__, db
 from storage.config import settings
+from storage.db.benchmark import benchmark_tenant_routing
 from storage.db.models.tenant import Tenant, Token
 from storage.db.multitenancy import tenant_create
-from storage.db.session import SessionLocal, engine, with_db
+from storage.db.query_plans import check_query_plans
+from storage.db.session import SessionLocal, async_engine, engine, with_db
 from storage.logging import log, setup_logging
+from storage.services.casdoor import casdoor
 from storage.services.content_processor import start_content_processor
+from storage.services.ingest_worker import run_ingest_worker, start_ingest_worker
+from storage.services.instant_storage import instant_storage
+from storage.services.usage import reconcile_all_usage
 from storage.web.api import api_router, tags_metadata
-from storage.web.security import create_api_key, get_api_key_hash
+from storage.web.credentials import revoked_tokens
+from storage.web.security import create_api_key, get_api_key_hash, hashing_executor
 
 
 def pre_start():
@@ -33,15 +43,57 @@ def pre_start():
     log.info("initialization complete")
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await instant_storage.start()
+    await casdoor.start()
+    if settings.ACCESS_TOKEN_REVOCATION_CHECK:
+        await revoked_tokens.start()
+    ingesting = None
+    if settings.INGEST_WORKER_IN_WEB:
+        ingesting = asyncio.create_task(run_ingest_worker())
+    yield
+    if ingesting is not None:
+        ingesting.cancel()
+        await asyncio.gather(ingesting, return_exceptions=True)
+    await revoked_tokens.close()
+    await casdoor.close()
+    await instant_storage.close()
+    await async_engine.dispose()
+    hashing_executor.shutdown()
+
+
+async def database_busy(request: Request, e: exc.TimeoutError) -> JSONResponse:
+    # no pooled connection or tenant session slot got free in time
+    log.warning(f"database busy, {request.url.path=}, {e}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Database is busy"},
+        headers={"Retry-After": "1"},
+    )
+
+
 def main(args):
     if args.content_processor:
         asyncio.run(start_content_processor())
 
         exit(0)
 
+    if args.ingest_worker:
+        asyncio.run(start_ingest_worker())
+        exit(0)
+
     if args.pre_start:
         pre_start()
         exit(0)
+    if args.check_query_plans:
+        exit(0 if check_query_plans() else 1)
+    if args.reconcile_usage:
+        asyncio.run(reconcile_all_usage())
+        exit(0)
+    if args.benchmark_rounds:
+        benchmark_tenant_routing(args.benchmark_rounds)
+        exit(0)
     if args.create_default_tenant or args.new_tenant_name:
         tenant_name = (
             "tenant_default" if args.create_default_tenant else args.new_tenant_name
@@ -90,6 +142,7 @@ def main(args):
         description="A RESTful API for storing files in web3 storage networks.",
         openapi_tags=tags_metadata,
         version=__version__,
+        lifespan=lifespan,
     )
     app.add_middleware(
         CORSMiddleware,
@@ -99,6 +152,7 @@ def main(args):
         allow_headers=["*"],
     )
     app.include_router(api_router)
+    app.add_exception_handler(exc.TimeoutError, database_busy)
     add_pagination(app)
 
     server = Server(
@@ -127,10 +181,31 @@ if __name__ == "__main__":
         help="start processor for files that should be encrypted and archived",
         action="store_true",
     )
+    group.add_argument(
+        "--ingest-worker",
+        help="start worker for contents to be fetched from their origins",
+        action="store_true",
+    )
 
     group.add_argument(
         "--pre-start", help="execute preliminary routine and exit", action="store_true"
     )
+    group.add_argument(
+        "--check-query-plans",
+        help="fail if a hot query is planned as a sequential scan in any tenant",
+        action="store_true",
+    )
+    group.add_argument(
+        "--reconcile-usage",
+        help="recount usage counters of all the tenants, repairing drift",
+        action="store_true",
+    )
+    group.add_argument(
+        "--benchmark-tenant-routing",
+        help="compare tenant schema routing modes over the given number of rounds",
+        dest="benchmark_rounds",
+        type=int,
+    )
     group.add_argument(
         "--tenant-create", help="creates new tenant", dest="new_tenant_name"
     )
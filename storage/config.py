@@ -55,12 +55,49 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str
     POSTGRES_DB: str
     SQLALCHEMY_DATABASE_URI: PostgresDsn | None = None
+    ASYNC_SQLALCHEMY_DATABASE_URI: PostgresDsn | None = None
+    # every process has a pool for sync and another one for async sessions
+    DB_POOL_SIZE: int = 10
+    DB_POOL_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800  # seconds, -1 keeps connections forever
+    DB_POOL_PRE_PING: bool = True
+    DB_TENANT_MAX_CONNECTIONS: int = 8  # per pool, 0 for no limit
+    TENANT_MIGRATION_CONCURRENCY: int = 8  # tenant schemas migrated at once, min 1
 
     INSTANT_STORAGE_REGION: str
     INSTANT_STORAGE_ENDPOINT: str
     INSTANT_STORAGE_ACCESS_KEY: str
     INSTANT_STORAGE_SECRET_ACCESS_KEY: str
     INSTANT_STORAGE_BUCKET_NAME: str
+    INSTANT_STORAGE_MAX_POOL_CONNECTIONS: int = 50
+    INSTANT_STORAGE_PART_SIZE: int = 16 * 1024 * 1024  # at least 5MiB
+    INSTANT_STORAGE_MAX_PARTS_IN_FLIGHT: int = 4
+    INSTANT_STORAGE_PART_ATTEMPTS: int = 3
+    INSTANT_STORAGE_LINK_EXPIRES_IN: int = 3600
+    INSTANT_STORAGE_LINK_MIN_EXPIRES_IN: int = 600  # links to renew before expiry
+    INSTANT_STORAGE_LINK_CACHE_SIZE: int = 100_000
+
+    UPLOAD_MAX_CHUNK_SIZE: int = 64 * 1024 * 1024
+    UPLOAD_EXPIRES_IN: int = 24 * 3600  # since the last chunk, seconds
+    UPLOAD_EXPIRY_INTERVAL: int = 600  # between expired uploads sweeps, seconds
+    UPLOAD_BATCH_MAX_FILES: int = 1000
+    UPLOAD_BATCH_CONCURRENCY: int = 8  # files of a batch ingested at the same time
+    UPLOAD_HASH_FIRST_MAX_SIZE: int = 1024 * 1024  # duplicates of these aren't sent
+
+    ORIGIN_TIMEOUT: float = 60
+    ORIGIN_RANGE_MIN_SIZE: int = 64 * 1024 * 1024  # smaller origins aren't split
+    ORIGIN_RANGE_SIZE: int = 8 * 1024 * 1024
+    ORIGIN_MAX_RANGES_IN_FLIGHT: int = 4
+    ORIGIN_RANGE_ATTEMPTS: int = 3
+
+    INGEST_WORKER_CONCURRENCY: int = 8  # tasks processed by a worker at the same time
+    INGEST_WORKER_IN_WEB: bool = True  # off with dedicated --ingest-worker processes
+    INGEST_POLL_INTERVAL: float = 1
+    INGEST_VISIBILITY_TIMEOUT: int = 300  # lease of a claimed task, seconds
+    INGEST_MAX_ATTEMPTS: int = 5
+    INGEST_RETRY_BACKOFF: int = 10  # delay before the first retry, seconds
+    INGEST_RETRY_MAX_BACKOFF: int = 3600
 
     CASDOOR_ENDPOINT: str
     CASDOOR_CLIENT_ID: str
@@ -68,8 +105,24 @@ class Settings(BaseSettings):
     CASDOOR_ORG_NAME: str
     CASDOOR_APPLICATION_NAME: str
     CASDOOR_CERTIFICATE = certificate
+    CASDOOR_TIMEOUT: float = 10
+    CASDOOR_MAX_CONNECTIONS: int = 100
+
+    TENANT_REGISTRY_SIZE: int = 10_000
+    TENANT_REGISTRY_TTL: int = 300
+    TENANT_REGISTRY_NEGATIVE_TTL: int = 10  # unknown hosts
+    # how tenant tables are found: "translate" renders the tenant schema into
+    # statements, "search_path" sets it for every transaction instead
+    TENANT_SCHEMA_ROUTING: Literal["translate", "search_path"] = "translate"
 
     ADMIN_TOKEN: str
+    API_KEY_HMAC_SECRET: str  # changing it invalidates all the API keys
+    CREDENTIAL_CACHE_SIZE: int = 10_000
+    CREDENTIAL_CACHE_TTL: int = 60  # seconds other processes may keep changed tokens
+    API_KEY_HASHING_THREADS: int = 4  # legacy bcrypt API keys verified in parallel
+    ACCESS_TOKEN_SIGNING_SECRET: str  # changing it invalidates all the signed tokens
+    ACCESS_TOKEN_REVOCATION_CHECK: bool = True
+    ACCESS_TOKEN_DENY_LIST_REFRESH_INTERVAL: int = 10  # seconds
 
     @validator("SQLALCHEMY_DATABASE_URI", pre=True)
     def assemble_db_connection(cls, v: str | None, values: dict[str, Any]) -> Any:
@@ -83,6 +136,13 @@ class Settings(BaseSettings):
             path=f"/{values.get('POSTGRES_DB') or ''}",
         )
 
+    @validator("ASYNC_SQLALCHEMY_DATABASE_URI", pre=True)
+    def assemble_async_db_connection(cls, v: str | None, values: dict[str, Any]) -> Any:
+        if isinstance(v, str):
+            return v
+        scheme, rest = str(values.get("SQLALCHEMY_DATABASE_URI")).split("://", 1)
+        return f"{scheme.split('+', 1)[0]}+asyncpg://{rest}"
+
     class Config:
         case_sensitive = True
 
@@ -3,7 +3,13 @@
 from storage.db.base_class import Base, TimestampMixin  # noqa
 from storage.db.models.content import *  # noqa
 from storage.db.models.filecoin import *  # noqa
+from storage.db.models.ingest import *  # noqa
+from storage.db.models.instant_storage import *  # noqa
 from storage.db.models.key import *  # noqa
 from storage.db.models.permission import *  # noqa
+from storage.db.models.revoked_token import *  # noqa
+from storage.db.models.tenant_migration import *  # noqa
 from storage.db.models.token import *  # noqa
+from storage.db.models.upload import *  # noqa
+from storage.db.models.usage import *  # noqa
 from storage.db.models.user import *  # noqa
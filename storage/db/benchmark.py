@@ -0,0 +1,41 @@
+import time
+
+from sqlalchemy import select
+
+from storage.db.models import Content, User
+from storage.db.models.tenant import Tenant
+from storage.db.session import SEARCH_PATH, TRANSLATE, engine, with_db
+from storage.logging import log
+
+
+def _query_tenants(schemas: list[str], routing: str, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for schema in schemas:
+            with with_db(schema, routing=routing) as db:
+                db.execute(select(User).limit(1)).all()
+                db.execute(
+                    select(Content).filter(Content.owner_id == 1).limit(10)
+                ).all()
+    return time.perf_counter() - started
+
+
+def benchmark_tenant_routing(rounds: int) -> None:
+    """Time sessions querying every tenant schema in both routing modes, to choose
+    `TENANT_SCHEMA_ROUTING` for the database at hand.
+    """
+
+    with with_db() as db:
+        schemas = db.scalars(select(Tenant.schema)).all()
+    if not schemas:
+        log.warning("no tenants to benchmark")
+        return
+    for routing in (TRANSLATE, SEARCH_PATH):
+        _query_tenants(schemas, routing, 1)  # warm up the pool and the caches
+        elapsed = _query_tenants(schemas, routing, rounds)
+        sessions = rounds * len(schemas)
+        log.info(
+            f"{routing=}, {len(schemas)=}, {sessions=}, "
+            f"{elapsed * 1e6 / sessions:.0f}us per session, "
+            f"{len(engine._compiled_cache)=}"
+        )
@@ -88,8 +88,13 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        # every revision is committed on its own, as tenant schemas are migrated
+        # outside of the revision transaction, see `for_each_tenant_schema`
         context.configure(
-            connection=connection, target_metadata=translated, include_schemas=True
+            connection=connection,
+            target_metadata=translated,
+            include_schemas=True,
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
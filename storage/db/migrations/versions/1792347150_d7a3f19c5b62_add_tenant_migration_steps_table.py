@@ -0,0 +1,35 @@
+"""add tenant migration steps table
+
+Revision ID: d7a3f19c5b62
+Revises: e12838dba343
+Create Date: 2026-10-18 18:12:30.218547
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d7a3f19c5b62"
+down_revision = "e12838dba343"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tenant_migration_steps",
+        sa.Column("step", sa.String(128), nullable=False),
+        sa.Column("tenant_schema", sa.String(256), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("step", "tenant_schema"),
+        schema="shared",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("tenant_migration_steps", schema="shared")
@@ -0,0 +1,41 @@
+"""add instant storage objects table
+
+Revision ID: 606edcc01088
+Revises: d7a3f19c5b62
+Create Date: 2026-10-18 18:13:28.412086
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "606edcc01088"
+down_revision = "d7a3f19c5b62"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "instant_storage_objects",
+        sa.Column("ipfs_cid", sa.String(256), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("ipfs_cid"),
+        schema="shared",
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("instant_storage_objects", schema="shared")
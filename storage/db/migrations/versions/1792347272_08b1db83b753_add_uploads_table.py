@@ -0,0 +1,68 @@
+"""add uploads table
+
+Revision ID: 08b1db83b753
+Revises: 606edcc01088
+Create Date: 2026-10-18 18:14:32.905143
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from storage.db.multitenancy import for_each_tenant_schema
+
+# revision identifiers, used by Alembic.
+revision = "08b1db83b753"
+down_revision = "606edcc01088"
+branch_labels = None
+depends_on = None
+
+
+@for_each_tenant_schema
+def upgrade(schema: str):
+    op.create_table(
+        "uploads",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("filename", sa.String(), nullable=True),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("upload_offset", sa.BigInteger(), server_default="0", nullable=False),
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("upload_id", sa.String(), nullable=False),
+        sa.Column("etags", sa.ARRAY(sa.String), server_default="{}", nullable=False),
+        sa.Column(
+            "hasher_state", postgresql.JSONB(astext_type=sa.Text()), nullable=False
+        ),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["owner_id"],
+            [f"{schema}.users.id"],
+            name=op.f("fk_uploads_owner_id_users"),
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_uploads")),
+        schema=schema,
+    )
+    op.create_index(
+        op.f(f"ix_{schema}_uploads_id"),
+        "uploads",
+        ["id"],
+        unique=False,
+        schema=schema,
+    )
+
+
+@for_each_tenant_schema
+def downgrade(schema: str):
+    op.drop_index(op.f(f"ix_{schema}_uploads_id"), table_name="uploads", schema=schema)
+    op.drop_table("uploads", schema=schema)
@@ -0,0 +1,73 @@
+"""add ingest tasks table
+
+Revision ID: 3c5e1b7d9a24
+Revises: 08b1db83b753
+Create Date: 2026-10-18 18:22:41.517208
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3c5e1b7d9a24"
+down_revision = "08b1db83b753"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ingest_tasks",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("tenant_schema", sa.String(64), nullable=False),
+        sa.Column("content_id", sa.Integer(), nullable=False),
+        sa.Column("origin", sa.String(), nullable=False),
+        sa.Column("status", sa.String(64), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column(
+            "run_after",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("worker_instance", sa.String(64), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        schema="shared",
+    )
+    op.create_index(
+        op.f("ix_ingest_tasks_id"),
+        "ingest_tasks",
+        ["id"],
+        unique=False,
+        schema="shared",
+    )
+    op.create_index(
+        "ix_ingest_tasks_status_run_after",
+        "ingest_tasks",
+        ["status", "run_after"],
+        unique=False,
+        schema="shared",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_ingest_tasks_status_run_after", table_name="ingest_tasks", schema="shared"
+    )
+    op.drop_index(
+        op.f("ix_ingest_tasks_id"), table_name="ingest_tasks", schema="shared"
+    )
+    op.drop_table("ingest_tasks", schema="shared")
@@ -0,0 +1,66 @@
+"""add revoked tokens table
+
+Revision ID: 5b7e2f4c81d6
+Revises: 3c5e1b7d9a24
+Create Date: 2026-10-18 18:24:43.902114
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5b7e2f4c81d6"
+down_revision = "3c5e1b7d9a24"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "revoked_tokens",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("tenant_schema", sa.String(64), nullable=False),
+        sa.Column("token_id", sa.Integer(), nullable=False),
+        sa.Column("revoked_after", sa.TIMESTAMP(), nullable=False),
+        sa.Column("token_expiry", sa.TIMESTAMP(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        schema="shared",
+    )
+    op.create_index(
+        op.f("ix_revoked_tokens_id"),
+        "revoked_tokens",
+        ["id"],
+        unique=False,
+        schema="shared",
+    )
+    op.create_index(
+        op.f("ix_revoked_tokens_token_expiry"),
+        "revoked_tokens",
+        ["token_expiry"],
+        unique=False,
+        schema="shared",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_revoked_tokens_token_expiry"),
+        table_name="revoked_tokens",
+        schema="shared",
+    )
+    op.drop_index(
+        op.f("ix_revoked_tokens_id"), table_name="revoked_tokens", schema="shared"
+    )
+    op.drop_table("revoked_tokens", schema="shared")
@@ -0,0 +1,47 @@
+"""add contents owner created at index
+
+Revision ID: 9d4a6c1e7f20
+Revises: 5b7e2f4c81d6
+Create Date: 2026-10-18 18:26:45.118364
+
+"""
+from alembic import op
+
+from storage.db.multitenancy import (
+    create_index_concurrently,
+    drop_index_concurrently,
+    for_each_tenant_schema,
+)
+
+# revision identifiers, used by Alembic.
+revision = "9d4a6c1e7f20"
+down_revision = "5b7e2f4c81d6"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # built concurrently, so tenants keep writing to contents meanwhile, which
+    # isn't possible inside a transaction
+    with op.get_context().autocommit_block():
+        create_index()
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        drop_index()
+
+
+@for_each_tenant_schema
+def create_index(schema: str):
+    create_index_concurrently(
+        schema,
+        "ix_contents_owner_id_created_at_id",
+        "contents",
+        "(owner_id, created_at, id)",
+    )
+
+
+@for_each_tenant_schema
+def drop_index(schema: str):
+    drop_index_concurrently(schema, "ix_contents_owner_id_created_at_id")
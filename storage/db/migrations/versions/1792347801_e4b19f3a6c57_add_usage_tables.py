@@ -0,0 +1,79 @@
+"""add usage tables
+
+Revision ID: e4b19f3a6c57
+Revises: 9d4a6c1e7f20
+Create Date: 2026-10-18 18:30:12.640275
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from storage.db.multitenancy import for_each_tenant_schema
+
+# revision identifiers, used by Alembic.
+revision = "e4b19f3a6c57"
+down_revision = "9d4a6c1e7f20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # already there when resuming after a failed tenant
+    if not sa.inspect(op.get_bind()).has_table("tenant_usage", schema="shared"):
+        op.create_table(
+            "tenant_usage",
+            sa.Column("tenant_schema", sa.String(256), nullable=False),
+            sa.Column("contents_number", sa.BigInteger(), nullable=False),
+            sa.Column("contents_size", sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint("tenant_schema", name=op.f("pk_tenant_usage")),
+            schema="shared",
+        )
+    upgrade_tenants()
+
+
+@for_each_tenant_schema
+def upgrade_tenants(schema: str):
+    op.create_table(
+        "user_usage",
+        sa.Column("owner_id", sa.Integer(), nullable=False),
+        sa.Column("contents_number", sa.BigInteger(), nullable=False),
+        sa.Column("contents_size", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["owner_id"],
+            [f"{schema}.users.id"],
+            name=op.f("fk_user_usage_owner_id_users"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("owner_id", name=op.f("pk_user_usage")),
+        schema=schema,
+    )
+    # counted from the existing contents
+    op.execute(
+        f"""
+        INSERT INTO "{schema}".user_usage (owner_id, contents_number, contents_size)
+        SELECT owner_id, count(id), coalesce(sum(ipfs_file_size), 0)
+        FROM "{schema}".contents
+        WHERE owner_id IS NOT NULL
+        GROUP BY owner_id
+        """
+    )
+    op.execute(
+        sa.text(
+            f"""
+            INSERT INTO shared.tenant_usage
+                (tenant_schema, contents_number, contents_size)
+            SELECT :schema, count(id), coalesce(sum(ipfs_file_size), 0)
+            FROM "{schema}".contents
+            """
+        ).bindparams(schema=schema)
+    )
+
+
+@for_each_tenant_schema
+def downgrade_tenants(schema: str):
+    op.drop_table("user_usage", schema=schema)
+
+
+def downgrade() -> None:
+    downgrade_tenants()
+    op.drop_table("tenant_usage", schema="shared")
@@ -0,0 +1,61 @@
+"""add hot query indexes
+
+Revision ID: 2a8f5d0b3e91
+Revises: e4b19f3a6c57
+Create Date: 2026-10-18 18:32:46.371529
+
+"""
+from alembic import op
+
+from storage.db.multitenancy import (
+    create_index_concurrently,
+    drop_index_concurrently,
+    for_each_tenant_schema,
+)
+
+# revision identifiers, used by Alembic.
+revision = "2a8f5d0b3e91"
+down_revision = "e4b19f3a6c57"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # built concurrently, so tenants keep writing to the tables meanwhile, which
+    # isn't possible inside a transaction
+    with op.get_context().autocommit_block():
+        create_indexes()
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        drop_indexes()
+
+
+# name, table and definition of the indexes
+INDEXES = (
+    ("ix_contents_origin", "contents", "USING hash (origin) WHERE origin IS NOT NULL"),
+    ("ix_contents_ipfs_cid", "contents", "(ipfs_cid)"),
+    (
+        "ix_contents_unencrypted_created_at",
+        "contents",
+        "(created_at) WHERE encrypted_file_cid IS NULL",
+    ),
+    (
+        "ix_permissions_assignee_id_content_id_kind",
+        "permissions",
+        "(assignee_id, content_id, kind)",
+    ),
+)
+
+
+@for_each_tenant_schema
+def create_indexes(schema: str):
+    for name, table_name, definition in INDEXES:
+        create_index_concurrently(schema, name, table_name, definition)
+
+
+@for_each_tenant_schema
+def drop_indexes(schema: str):
+    for name, _, _ in reversed(INDEXES):
+        drop_index_concurrently(schema, name)
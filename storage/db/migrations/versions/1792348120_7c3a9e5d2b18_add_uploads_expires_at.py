@@ -0,0 +1,40 @@
+"""add uploads expires_at
+
+Revision ID: 7c3a9e5d2b18
+Revises: 2a8f5d0b3e91
+Create Date: 2026-10-18 19:02:00.218764
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from storage.config import settings
+from storage.db.multitenancy import for_each_tenant_schema
+
+# revision identifiers, used by Alembic.
+revision = "7c3a9e5d2b18"
+down_revision = "2a8f5d0b3e91"
+branch_labels = None
+depends_on = None
+
+
+@for_each_tenant_schema
+def upgrade(schema: str):
+    op.add_column(
+        "uploads",
+        sa.Column("expires_at", sa.TIMESTAMP(), nullable=True),
+        schema=schema,
+    )
+    # uploads in progress get the full term from their last chunk
+    op.execute(
+        sa.text(
+            f'UPDATE "{schema}".uploads'
+            " SET expires_at = updated_at + make_interval(secs => :expires_in)"
+        ).bindparams(expires_in=settings.UPLOAD_EXPIRES_IN)
+    )
+    op.alter_column("uploads", "expires_at", nullable=False, schema=schema)
+
+
+@for_each_tenant_schema
+def downgrade(schema: str):
+    op.drop_column("uploads", "expires_at", schema=schema)
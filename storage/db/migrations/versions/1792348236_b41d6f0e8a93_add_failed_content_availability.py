@@ -0,0 +1,33 @@
+"""add failed content availability
+
+Revision ID: b41d6f0e8a93
+Revises: 7c3a9e5d2b18
+Create Date: 2026-10-18 19:05:47.530117
+
+"""
+from alembic import op
+
+from storage.db.multitenancy import for_each_tenant_schema
+
+# revision identifiers, used by Alembic.
+revision = "b41d6f0e8a93"
+down_revision = "7c3a9e5d2b18"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # a value added to an enum can't be used in the transaction adding it
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE contentavailability ADD VALUE IF NOT EXISTS 'FAILED'")
+
+
+@for_each_tenant_schema
+def downgrade(schema: str):
+    # enum values can't be dropped, failed contents go back to pending
+    op.execute(
+        f"""
+        UPDATE "{schema}".contents SET availability = 'PENDING'
+        WHERE availability = 'FAILED'
+        """
+    )
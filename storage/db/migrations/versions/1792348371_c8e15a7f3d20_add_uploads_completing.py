@@ -0,0 +1,31 @@
+"""add uploads completing
+
+Revision ID: c8e15a7f3d20
+Revises: b41d6f0e8a93
+Create Date: 2026-10-18 19:08:02.914386
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+from storage.db.multitenancy import for_each_tenant_schema
+
+# revision identifiers, used by Alembic.
+revision = "c8e15a7f3d20"
+down_revision = "b41d6f0e8a93"
+branch_labels = None
+depends_on = None
+
+
+@for_each_tenant_schema
+def upgrade(schema: str):
+    op.add_column(
+        "uploads",
+        sa.Column("completing", sa.Boolean(), server_default="false", nullable=False),
+        schema=schema,
+    )
+
+
+@for_each_tenant_schema
+def downgrade(schema: str):
+    op.drop_column("uploads", "completing", schema=schema)
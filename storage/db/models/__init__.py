@@ -3,6 +3,7 @@ from storage.db.models.job import Job
 from storage.db.models.key import Key
 from storage.db.models.permission import Permission
 from storage.db.models.token import Token
+from storage.db.models.upload import Upload
 from storage.db.models.user import User
 
-__all__ = [Token, User, Content, Permission, Key, Job]
+__all__ = [Token, User, Content, Permission, Key, Job, Upload]
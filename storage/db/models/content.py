@@ -7,9 +7,11 @@ from sqlalchemy import (
     Column,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     String,
     func,
+    text,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy_utils.types import URLType
@@ -24,6 +26,7 @@ class ContentAvailability(str, enum.Enum):
     ENCRYPTED = "encrypted"
     ARCHIVE = "archive"
     ABSENT = "absent"
+    FAILED = "failed"  # its origin couldn't be ingested
 
 
 class Content(TimestampMixin, Base):
@@ -49,4 +52,22 @@ class Content(TimestampMixin, Base):
     permissions = relationship("Permission", back_populates="content")
     jobs = relationship("Job", back_populates="content")
 
-    __table_args__ = ({"schema": "tenant"},)
+    __table_args__ = (
+        # keyset pagination of owner contents
+        Index("ix_contents_owner_id_created_at_id", "owner_id", "created_at", "id"),
+        # duplicate origin check, hashed as URLs may exceed the btree entry size
+        Index(
+            "ix_contents_origin",
+            "origin",
+            postgresql_using="hash",
+            postgresql_where=text("origin IS NOT NULL"),
+        ),
+        Index("ix_contents_ipfs_cid", "ipfs_cid"),
+        # contents waiting for the content processor
+        Index(
+            "ix_contents_unencrypted_created_at",
+            "created_at",
+            postgresql_where=text("encrypted_file_cid IS NULL"),
+        ),
+        {"schema": "tenant"},
+    )
@@ -0,0 +1,38 @@
+from sqlalchemy import TIMESTAMP, Column, Index, Integer, String, func
+
+from storage.db.base_class import Base, TimestampMixin
+
+
+class IngestTaskStatus:
+    PENDING = "pending"
+    PROCESSING = "processing"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class IngestTask(TimestampMixin, Base):
+    """Origin ingest waiting for or being processed by an ingest worker.
+
+    `run_after` is when the task becomes available to workers: the retry time for
+    pending tasks and the lease expiry for processing ones, so a task of a crashed
+    worker is taken by another one.
+    """
+
+    __tablename__ = "ingest_tasks"
+
+    id = Column("id", Integer, primary_key=True, index=True)
+    tenant_schema = Column("tenant_schema", String(64), nullable=False)
+    content_id = Column("content_id", Integer, nullable=False)
+    origin = Column("origin", String, nullable=False)
+    status = Column("status", String(64), nullable=False)
+    attempts = Column("attempts", Integer, nullable=False, default=0)
+    run_after = Column(
+        "run_after", TIMESTAMP, nullable=False, server_default=func.now()
+    )
+    worker_instance = Column("worker_instance", String(64), nullable=True)
+    error = Column("error", String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_ingest_tasks_status_run_after", "status", "run_after"),
+        {"schema": "shared"},
+    )
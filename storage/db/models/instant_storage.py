@@ -0,0 +1,16 @@
+from sqlalchemy import BigInteger, Column, String
+
+from storage.db.base_class import Base, TimestampMixin
+
+
+class InstantStorageObject(TimestampMixin, Base):
+    """Object stored in instant storage under its CID. Objects are shared by all the
+    tenants, so the same data is stored only once.
+    """
+
+    __tablename__ = "instant_storage_objects"
+
+    ipfs_cid = Column("ipfs_cid", String(256), primary_key=True)
+    size = Column("size", BigInteger, nullable=True)
+
+    __table_args__ = ({"schema": "shared"},)
@@ -1,6 +1,6 @@
 import enum
 
-from sqlalchemy import Column, Enum, ForeignKey, Integer
+from sqlalchemy import Column, Enum, ForeignKey, Index, Integer
 from sqlalchemy.orm import relationship
 
 from storage.db.base_class import Base
@@ -27,4 +27,12 @@ class Permission(Base):
     )
     assignee = relationship("User", back_populates="permissions")
 
-    __table_args__ = ({"schema": "tenant"},)
+    __table_args__ = (
+        Index(
+            "ix_permissions_assignee_id_content_id_kind",
+            "assignee_id",
+            "content_id",
+            "kind",
+        ),
+        {"schema": "tenant"},
+    )
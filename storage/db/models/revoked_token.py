@@ -0,0 +1,23 @@
+from sqlalchemy import TIMESTAMP, Column, Integer, String
+
+from storage.db.base_class import Base, TimestampMixin
+
+
+class RevokedToken(TimestampMixin, Base):
+    """Deny-list entry of a user access token.
+
+    Signed access tokens are verified without a token lookup, so a token deleted
+    or cut short stays valid unless it's listed here. The token is rejected from
+    `revoked_after` on. An entry is useless once the token expires by itself, it's
+    the token's `expiry` kept in `token_expiry`.
+    """
+
+    __tablename__ = "revoked_tokens"
+
+    id = Column("id", Integer, primary_key=True, index=True)
+    tenant_schema = Column("tenant_schema", String(64), nullable=False)
+    token_id = Column("token_id", Integer, nullable=False)
+    revoked_after = Column("revoked_after", TIMESTAMP, nullable=False)
+    token_expiry = Column("token_expiry", TIMESTAMP, nullable=True, index=True)
+
+    __table_args__ = ({"schema": "shared"},)
@@ -0,0 +1,20 @@
+from sqlalchemy import TIMESTAMP, Column, String, func
+
+from storage.db.base_class import Base
+
+
+class TenantMigrationStep(Base):
+    """Tenant schema a per-tenant migration step was applied to, so a failed or
+    interrupted migration resumes with the schemas left. Rows of a step are
+    deleted once its revision is applied.
+    """
+
+    __tablename__ = "tenant_migration_steps"
+
+    step = Column("step", String(128), primary_key=True)
+    tenant_schema = Column("tenant_schema", String(256), primary_key=True)
+    created_at = Column(
+        "created_at", TIMESTAMP, nullable=False, server_default=func.now()
+    )
+
+    __table_args__ = ({"schema": "shared"},)
@@ -0,0 +1,38 @@
+from sqlalchemy import (
+    ARRAY,
+    TIMESTAMP,
+    BigInteger,
+    Boolean,
+    Column,
+    ForeignKey,
+    Integer,
+    String,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+
+from storage.db.base_class import Base, TimestampMixin
+
+
+class Upload(TimestampMixin, Base):
+    """Resumable upload in progress. Received chunks are stored as parts of
+    a multipart upload to instant storage, and the CID is computed as they come.
+    Uploads not continued for `UPLOAD_EXPIRES_IN` seconds are aborted.
+    """
+
+    __tablename__ = "uploads"
+
+    id = Column("id", Integer, primary_key=True, index=True)
+    filename = Column("filename", String, nullable=True)
+    size = Column("size", BigInteger, nullable=False)
+    offset = Column("upload_offset", BigInteger, nullable=False, server_default="0")
+    key = Column("key", String, nullable=False)
+    upload_id = Column("upload_id", String, nullable=False)
+    etags = Column("etags", ARRAY(String), nullable=False, server_default="{}")
+    hasher_state = Column("hasher_state", JSONB, nullable=False)
+    owner_id = Column("owner_id", Integer, ForeignKey("tenant.users.id"))
+    # renewed with every chunk, expired uploads are aborted by `expire_uploads`
+    expires_at = Column("expires_at", TIMESTAMP, nullable=False)
+    # set once all the chunks are received and the upload is being completed
+    completing = Column("completing", Boolean, nullable=False, server_default="false")
+
+    __table_args__ = ({"schema": "tenant"},)
@@ -0,0 +1,34 @@
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, String
+
+from storage.db.base_class import Base
+
+
+class UserUsage(Base):
+    """Contents of a user counted as they're created, resized and deleted, so stats
+    don't aggregate the contents table.
+    """
+
+    __tablename__ = "user_usage"
+
+    owner_id = Column(
+        "owner_id",
+        Integer,
+        ForeignKey("tenant.users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    contents_number = Column("contents_number", BigInteger, nullable=False, default=0)
+    contents_size = Column("contents_size", BigInteger, nullable=False, default=0)
+
+    __table_args__ = ({"schema": "tenant"},)
+
+
+class TenantUsage(Base):
+    """Contents of all the users of a tenant, see `UserUsage`."""
+
+    __tablename__ = "tenant_usage"
+
+    tenant_schema = Column("tenant_schema", String(256), primary_key=True)
+    contents_number = Column("contents_number", BigInteger, nullable=False, default=0)
+    contents_size = Column("contents_size", BigInteger, nullable=False, default=0)
+
+    __table_args__ = ({"schema": "shared"},)
@@ -1,16 +1,25 @@
 import functools
-from contextlib import contextmanager
+import multiprocessing
+import threading
+import time
+import traceback
 from typing import Callable
 
 from alembic import op
-from sqlalchemy import MetaData
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import MetaData, create_engine, delete, insert, inspect, select, text
+from sqlalchemy.pool import NullPool
 from sqlalchemy.schema import CreateSchema
 from typeguard import typechecked
 
+from storage.config import settings
 from storage.db.base_class import Base
 from storage.db.models import User
 from storage.db.models.tenant import Tenant
-from storage.db.session import SessionLocal, engine
+from storage.db.models.tenant_migration import TenantMigrationStep
+from storage.db.session import TRANSLATE, with_db
+from storage.logging import log
 
 
 def get_shared_metadata():
@@ -30,7 +39,8 @@ def get_tenant_specific_metadata():
 
 
 def tenant_create(tenant: Tenant) -> Tenant:
-    with with_db(tenant.schema) as db:
+    # tables are created in the schema by their names, not through the search path
+    with with_db(tenant.schema, routing=TRANSLATE) as db:
         db.add(tenant)
         db.execute(CreateSchema(tenant.schema))
         get_tenant_specific_metadata().create_all(bind=db.connection())
@@ -38,31 +48,213 @@ def tenant_create(tenant: Tenant) -> Tenant:
         db.add(user)
         db.commit()
         db.refresh(tenant)
+    tenant_registry.invalidate(tenant.host)
     return tenant
 
 
-@contextmanager
-def with_db(tenant_schema: str | None):
-    if tenant_schema:
-        schema_translate_map = dict(tenant=tenant_schema)
-    else:
-        schema_translate_map = None
+class TenantRegistry:
+    """Per-process map of hosts to tenants, so requests don't query the tenants
+    table. Tenants are kept for `TENANT_REGISTRY_TTL` seconds, unknown hosts for
+    `TENANT_REGISTRY_NEGATIVE_TTL` seconds. Hosts are evicted oldest first when
+    there are more than `max_size` of them.
+    """
 
-    connectable = engine.execution_options(schema_translate_map=schema_translate_map)
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._entries: dict[str, tuple[Tenant | None, float]] = {}
+        self._lock = threading.Lock()
 
+    def get(self, host: str) -> Tenant | None:
+        with self._lock:
+            entry = self._entries.get(host)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        with with_db(None) as db:
+            tenant = db.query(Tenant).filter(Tenant.host == host).one_or_none()
+        if tenant is None:
+            ttl = settings.TENANT_REGISTRY_NEGATIVE_TTL
+        else:
+            ttl = settings.TENANT_REGISTRY_TTL
+        with self._lock:
+            self._entries.pop(host, None)
+            self._entries[host] = (tenant, time.monotonic() + ttl)
+            if len(self._entries) > self._max_size:
+                del self._entries[next(iter(self._entries))]
+        return tenant
+
+    def invalidate(self, host: str) -> None:
+        with self._lock:
+            self._entries.pop(host, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+tenant_registry = TenantRegistry(settings.TENANT_REGISTRY_SIZE)
+
+
+# state of a worker process migrating tenant schemas, see `for_each_tenant_schema`
+_worker_engine = None
+_worker_step: tuple[str | None, Callable] | None = None
+
+
+def _start_worker(url, isolation_level: str | None, step: str | None, func: Callable):
+    global _worker_engine, _worker_step
+    options = {"isolation_level": isolation_level} if isolation_level else {}
+    _worker_engine = create_engine(url, poolclass=NullPool, **options)
+    _worker_step = (step, func)
+
+
+def _migrate_tenant_schema(schema: str) -> tuple[str, str | None]:
+    """Apply the step to the schema and record it as done in the same transaction,
+    unless in autocommit mode or the step isn't recorded. Gives the traceback if
+    the step failed.
+    """
+
+    step, func = _worker_step
     try:
-        db = SessionLocal(bind=connectable)
-        yield db
-    finally:
-        db.close()
+        with _worker_engine.begin() as connection:
+            # `op` is bound per process, it proxies the context of this connection
+            with Operations.context(MigrationContext.configure(connection)):
+                func(schema)
+            if step is not None:
+                connection.execute(
+                    insert(TenantMigrationStep).values(step=step, tenant_schema=schema)
+                )
+    except Exception:
+        return schema, traceback.format_exc()
+    return schema, None
 
 
 @typechecked
 def for_each_tenant_schema(func: Callable) -> Callable:
+    """Apply the migration step to every tenant schema, over up to
+    `TENANT_MIGRATION_CONCURRENCY` connections at once, one at a time below 1.
+    Each schema is migrated in its own transaction and recorded as done, so a
+    failed or interrupted run is resumed with the schemas left. The step raises
+    once all the schemas are tried if any of them failed. Revisions older than
+    the steps table aren't recorded and start over.
+
+    Steps run in forked processes, as `op` isn't thread-safe, and see committed
+    changes only: what the revision did before the step is committed first. The
+    revision is marked as applied, and its progress cleared, in the transaction
+    following the step, so a revision failing in its step stays unapplied, with
+    the work before the step committed. Run `alembic upgrade` again to resume it
+    once the cause is fixed, the work before the step has to be rerunnable. Steps
+    in autocommit mode are rerun on the schemas they failed on, so they have to
+    be rerunnable too.
+    """
+
+    step = f"{func.__globals__.get('revision', func.__module__)}:{func.__name__}"
+
     @functools.wraps(func)
     def wrapped():
-        schemas = op.get_bind().execute("SELECT schema FROM shared.tenants").fetchall()
-        for (schema,) in schemas:
-            func(schema)
+        if op.get_bind().get_execution_options().get("isolation_level") == "AUTOCOMMIT":
+            tracked = run(isolation_level="AUTOCOMMIT")
+        else:
+            with op.get_context().autocommit_block():
+                tracked = run(isolation_level=None)
+        if tracked:
+            # all the schemas are migrated, along with the version bump unless in
+            # autocommit mode
+            op.get_bind().execute(
+                delete(TenantMigrationStep).filter(TenantMigrationStep.step == step)
+            )
+
+    def run(isolation_level: str | None) -> bool:
+        bind = op.get_bind()
+        tracked = inspect(bind).has_table(
+            TenantMigrationStep.__tablename__, schema="shared"
+        )
+        schemas = [
+            schema
+            for (schema,) in bind.execute(
+                select(Tenant.schema).order_by(Tenant.schema)
+            ).fetchall()
+        ]
+        done = set()
+        if tracked:
+            done.update(
+                bind.execute(
+                    select(TenantMigrationStep.tenant_schema).filter(
+                        TenantMigrationStep.step == step
+                    )
+                ).scalars()
+            )
+        pending = [schema for schema in schemas if schema not in done]
+        if done:
+            log.info(f"resuming tenant migration, {step=}, done={len(done)}")
+
+        failed = {}
+        if pending:
+            processes = max(min(settings.TENANT_MIGRATION_CONCURRENCY, len(pending)), 1)
+            pool = multiprocessing.get_context("fork").Pool(
+                processes,
+                initializer=_start_worker,
+                initargs=(
+                    bind.engine.url,
+                    isolation_level,
+                    step if tracked else None,
+                    func,
+                ),
+            )
+            with pool:
+                results = pool.imap_unordered(_migrate_tenant_schema, pending)
+                for n, (schema, error) in enumerate(results, len(done) + 1):
+                    if error is None:
+                        log.info(
+                            f"tenant migrated, {step=}, {schema=}, {n}/{len(schemas)}"
+                        )
+                    else:
+                        failed[schema] = error
+                        log.error(
+                            f"tenant migration failure, {step=}, {schema=}, "
+                            f"{n}/{len(schemas)}\n{error}"
+                        )
+        if failed:
+            raise RuntimeError(
+                f"tenant migration failed for {len(failed)} of {len(schemas)} "
+                f"schemas, {step=}: {', '.join(sorted(failed))}"
+            )
+        return tracked
 
     return wrapped
+
+
+def create_index_concurrently(
+    schema: str, name: str, table_name: str, definition: str
+) -> None:
+    """Build the index without blocking writes to the table, in autocommit mode.
+    A build failing midway leaves the index invalid, it's built again on a rerun,
+    while a valid one is kept.
+    """
+
+    valid = (
+        op.get_bind()
+        .execute(
+            text(
+                """
+                SELECT i.indisvalid FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = :schema AND c.relname = :name
+                """
+            ),
+            dict(schema=schema, name=name),
+        )
+        .scalar()
+    )
+    if valid is False:
+        drop_index_concurrently(schema, name)
+    op.execute(
+        f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}"
+        ON "{schema}".{table_name} {definition}
+        """
+    )
+
+
+def drop_index_concurrently(schema: str, name: str) -> None:
+    op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{schema}"."{name}"')
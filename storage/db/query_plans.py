@@ -0,0 +1,84 @@
+import datetime
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from storage.db.models import Content, Permission
+from storage.db.models.permission import PermissionKind
+from storage.db.models.tenant import Tenant
+from storage.db.session import with_db
+from storage.logging import log
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def hot_queries() -> dict:
+    """Queries made on every request or by every worker pass, by name."""
+
+    return {
+        "duplicate origin": select(Content.id).filter(
+            Content.owner_id == 1, Content.origin == "https://example.com/file"
+        ),
+        "contents by cids": select(Content).filter(
+            Content.ipfs_cid.in_(["bafkreigh2akiscaildc"])
+        ),
+        "read permission": select(Permission).filter(
+            Permission.assignee_id == 1,
+            Permission.content_id == 1,
+            Permission.kind == PermissionKind.READ,
+        ),
+        "unencrypted contents": select(Content).filter(
+            Content.encrypted_file_cid == None,  # noqa: E711
+            Content.created_at >= datetime.datetime(2023, 5, 25),
+        ),
+        "owner contents page": select(Content)
+        .filter(Content.owner_id == 1)
+        .order_by(Content.created_at, Content.id)
+        .limit(51),
+    }
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    scans = [plan["Relation Name"]] if plan["Node Type"] == "Seq Scan" else []
+    for subplan in plan.get("Plans", []):
+        scans.extend(_seq_scans(subplan))
+    return scans
+
+
+def seq_scans(db: Session, statement) -> list[str]:
+    """Tables the statement scans whole. Sequential scans are disabled for
+    planning, so one is planned only when no index fits.
+    """
+
+    db.execute(text("SET LOCAL enable_seqscan = off"))
+    [[explained]] = db.execute(Explain(statement)).all()
+    return _seq_scans(explained[0]["Plan"])
+
+
+def check_query_plans() -> bool:
+    """Check no hot query scans a whole table in any tenant schema."""
+
+    with with_db() as db:
+        schemas = db.scalars(select(Tenant.schema)).all()
+    ok = True
+    for schema in schemas:
+        with with_db(schema) as db:
+            for name, statement in hot_queries().items():
+                scans = seq_scans(db, statement)
+                if scans:
+                    log.error(f"sequential scan, {schema=}, {name=}, {scans=}")
+                    ok = False
+    log.info(f"query plans checked, {len(schemas)=}, {ok=}")
+    return ok
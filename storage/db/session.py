@@ -1,25 +1,218 @@
-from contextlib import contextmanager
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.util import await_only
 
+from storage import metrics
 from storage.config import settings
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI)
+# tenant schema routing modes, see `TENANT_SCHEMA_ROUTING`
+TRANSLATE = "translate"
+SEARCH_PATH = "search_path"
+
+
+# tenant of the session a connection is checked out for, see `_MeasuredPool`
+_checkout_tenant: ContextVar[str | None] = ContextVar("checkout_tenant", default=None)
+
+
+class _MeasuredPool(ABC):
+    """Pool mixin timing checkouts and capping the connections a tenant may have
+    checked out at the same time to `DB_TENANT_MAX_CONNECTIONS`, so one tenant
+    can't take all of them. A connection counts for the tenant from its checkout
+    till its checkin, sessions hold connections for their transactions only.
+    Checkouts wait once all the connections are taken, so the time grows with
+    the pool saturation.
+    """
+
+    checkout_wait: metrics.Summary
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tenant_slots = {}
+
+    @abstractmethod
+    def _acquire_tenant_slot(self, tenant_schema: str):
+        """Wait for a slot of the tenant and return it, or raise `TimeoutError`."""
+
+    def _do_get(self):
+        tenant_schema = _checkout_tenant.get()
+        slot = None
+        if tenant_schema and settings.DB_TENANT_MAX_CONNECTIONS:
+            slot = self._acquire_tenant_slot(tenant_schema)
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except BaseException:
+            if slot is not None:
+                slot.release()
+            raise
+        finally:
+            self.checkout_wait.observe(time.perf_counter() - started)
+        # `info` is cleared when the connection is recycled or reconnected
+        record.record_info["tenant_slot"] = slot
+        return record
+
+    def _do_return_conn(self, record):
+        slot = record.record_info.pop("tenant_slot", None)
+        try:
+            super()._do_return_conn(record)
+        finally:
+            if slot is not None:
+                slot.release()
+
+
+def _tenant_slot_timeout(tenant_schema: str) -> exc.TimeoutError:
+    return exc.TimeoutError(
+        f"tenant {tenant_schema} has {settings.DB_TENANT_MAX_CONNECTIONS} "
+        f"connections checked out, timed out after {settings.DB_POOL_TIMEOUT} seconds"
+    )
+
+
+class MeasuredQueuePool(_MeasuredPool, QueuePool):
+    checkout_wait = metrics.Summary(
+        "storage_db_pool_checkout_wait_seconds",
+        "Time spent waiting for a database connection.",
+        dict(pool="sync"),
+    )
+
+    def _acquire_tenant_slot(self, tenant_schema: str):
+        slot = self._tenant_slots.get(tenant_schema)
+        if slot is None:
+            slot = self._tenant_slots.setdefault(
+                tenant_schema,
+                threading.BoundedSemaphore(settings.DB_TENANT_MAX_CONNECTIONS),
+            )
+        if not slot.acquire(timeout=settings.DB_POOL_TIMEOUT):
+            raise _tenant_slot_timeout(tenant_schema)
+        return slot
+
+
+class MeasuredAsyncQueuePool(_MeasuredPool, AsyncAdaptedQueuePool):
+    checkout_wait = metrics.Summary(
+        "storage_db_pool_checkout_wait_seconds",
+        "Time spent waiting for a database connection.",
+        dict(pool="async"),
+    )
+
+    def _acquire_tenant_slot(self, tenant_schema: str):
+        # checkouts of the asyncio pool run in the greenlet of the awaiting task
+        slot = self._tenant_slots.setdefault(
+            tenant_schema, asyncio.Semaphore(settings.DB_TENANT_MAX_CONNECTIONS)
+        )
+        try:
+            await_only(asyncio.wait_for(slot.acquire(), settings.DB_POOL_TIMEOUT))
+        except asyncio.TimeoutError:
+            raise _tenant_slot_timeout(tenant_schema)
+        return slot
+
+
+def _pool_options() -> dict:
+    return dict(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_POOL_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URI, poolclass=MeasuredQueuePool, **_pool_options()
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(
+    settings.ASYNC_SQLALCHEMY_DATABASE_URI,
+    poolclass=MeasuredAsyncQueuePool,
+    **_pool_options(),
+)
+# objects aren't expired on commit, as loading expired attributes implicitly
+# isn't possible with asyncio
+AsyncSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+    bind=async_engine,
+    class_=AsyncSession,
+)
 
-@contextmanager
-def with_db(tenant_schema: str | None = None):
+for pool_name, pool_engine in (("sync", engine), ("async", async_engine.sync_engine)):
+    metrics.register_gauge(
+        "storage_db_pool_checked_out",
+        "Database connections in use.",
+        lambda pool_engine=pool_engine: pool_engine.pool.checkedout(),
+        dict(pool=pool_name),
+    )
+    metrics.register_gauge(
+        "storage_db_pool_saturation",
+        "Share of the pool capacity, overflow included, in use.",
+        lambda pool_engine=pool_engine: pool_engine.pool.checkedout()
+        / (settings.DB_POOL_SIZE + settings.DB_POOL_MAX_OVERFLOW),
+        dict(pool=pool_name),
+    )
+
+
+@lru_cache(maxsize=settings.TENANT_REGISTRY_SIZE)
+def _tenant_connectable(engine, tenant_schema: str | None):
+    # an option-bound engine per session is not free to create, so one per schema
+    # is kept, None leaves tenant tables unqualified
+    return engine.execution_options(schema_translate_map=dict(tenant=tenant_schema))
+
+
+def _session_options(engine, tenant_schema: str | None, routing: str | None) -> dict:
+    if not tenant_schema:
+        return dict(bind=engine)
+    if (routing or settings.TENANT_SCHEMA_ROUTING) == SEARCH_PATH:
+        return dict(
+            bind=_tenant_connectable(engine, None),
+            info=dict(search_path=tenant_schema),
+        )
+    return dict(bind=_tenant_connectable(engine, tenant_schema))
+
+
+@event.listens_for(Session, "after_begin")
+def _set_search_path(session, transaction, connection):
+    tenant_schema = session.info.get("search_path")
     if tenant_schema:
-        schema_translate_map = dict(tenant=tenant_schema)
-    else:
-        schema_translate_map = None
+        connection.execute(
+            text("SELECT set_config('search_path', :search_path, true)"),
+            dict(search_path='"{}"'.format(tenant_schema.replace('"', '""'))),
+        )
 
-    connectable = engine.execution_options(schema_translate_map=schema_translate_map)
 
+@contextmanager
+def _checking_out_for(tenant_schema: str | None):
+    # a session nested in another one sets its own tenant for its lifetime
+    token = _checkout_tenant.set(tenant_schema)
     try:
-        db = SessionLocal(bind=connectable)
-        yield db
+        yield
     finally:
-        db.close()
+        _checkout_tenant.reset(token)
+
+
+@contextmanager
+def with_db(tenant_schema: str | None = None, routing: str | None = None):
+    with _checking_out_for(tenant_schema):
+        try:
+            db = SessionLocal(**_session_options(engine, tenant_schema, routing))
+            yield db
+        finally:
+            db.close()
+
+
+@asynccontextmanager
+async def with_async_db(tenant_schema: str | None = None, routing: str | None = None):
+    with _checking_out_for(tenant_schema):
+        async with AsyncSessionLocal(
+            **_session_options(async_engine, tenant_schema, routing)
+        ) as db:
+            yield db
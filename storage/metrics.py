@@ -0,0 +1,59 @@
+import threading
+from typing import Callable
+
+# name -> (help, type, samples of (suffix, labels, callback returning the value))
+_families: dict[str, tuple[str, str, list[tuple[str, dict, Callable[[], float]]]]] = {}
+
+
+def _register(
+    name: str,
+    help: str,
+    kind: str,
+    suffix: str,
+    labels: dict | None,
+    callback: Callable[[], float],
+) -> None:
+    _, _, samples = _families.setdefault(name, (help, kind, []))
+    samples.append((suffix, labels or {}, callback))
+
+
+def register_gauge(
+    name: str, help: str, callback: Callable[[], float], labels: dict | None = None
+) -> None:
+    """Register a gauge read by the callback whenever metrics are collected."""
+
+    _register(name, help, "gauge", "", labels, callback)
+
+
+class Summary:
+    """Number and sum of observed values, e.g. of durations."""
+
+    def __init__(self, name: str, help: str, labels: dict | None = None):
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+        _register(name, help, "summary", "_sum", labels, lambda: self.sum)
+        _register(name, help, "summary", "_count", labels, lambda: self.count)
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.sum += value
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def render() -> str:
+    """Render current values of the metrics in Prometheus text format."""
+
+    lines = []
+    for name, (help, kind, samples) in sorted(_families.items()):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, callback in samples:
+            lines.append(f"{name}{suffix}{_format_labels(labels)} {callback()}")
+    return "\n".join(lines) + "\n"
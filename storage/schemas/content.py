@@ -46,3 +46,9 @@ class Content(ContentInDBBase):
 
 class ContentInDB(ContentInDBBase):
     pass
+
+
+class ContentBatchItem(BaseModel):
+    filename: str | None = None
+    content: Content | None = None
+    error: str | None = None
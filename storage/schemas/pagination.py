@@ -0,0 +1,12 @@
+from typing import Generic, TypeVar
+
+from fastapi_camelcase import CamelModel as BaseModel
+from pydantic.generics import GenericModel
+
+T = TypeVar("T")
+
+
+class CursorPage(BaseModel, GenericModel, Generic[T]):
+    items: list[T]
+    next_cursor: str | None = None  # absent on the last page
+    total: int | None = None  # counted on request only
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from fastapi_camelcase import CamelModel as BaseModel
+from pydantic import conint
+
+
+class UploadBase(BaseModel):
+    filename: str | None = None
+    size: conint(ge=0)
+
+
+class UploadCreate(UploadBase):
+    pass
+
+
+class UploadInDBBase(UploadBase):
+    id: int
+    offset: int
+    owner_id: int
+    created_at: datetime
+    updated_at: datetime
+    expires_at: datetime
+    completing: bool
+
+    class Config:
+        orm_mode = True
+
+
+class Upload(UploadInDBBase):
+    pass
+
+
+class UploadInDB(UploadInDBBase):
+    pass
@@ -0,0 +1,81 @@
+import asyncio
+from functools import lru_cache
+
+import httpx
+import jwt
+from casdoor import CasdoorSDK
+from cryptography import x509
+
+from storage.config import settings
+
+
+@lru_cache(maxsize=8)
+def _public_key(certificate: str):
+    return x509.load_pem_x509_certificate(certificate.encode()).public_key()
+
+
+class CasdoorClient:
+    """Casdoor SDK shared by all the sign-ins.
+
+    The SDK exchanges authorization codes with blocking requests, so the exchange
+    goes through a pooled async HTTP client instead. The web application starts
+    and closes the client with its lifespan.
+    """
+
+    def __init__(self):
+        self.sdk = CasdoorSDK(
+            endpoint=settings.CASDOOR_ENDPOINT,
+            client_id=settings.CASDOOR_CLIENT_ID,
+            client_secret=settings.CASDOOR_CLIENT_SECRET,
+            certificate=settings.CASDOOR_CERTIFICATE,
+            org_name=settings.CASDOOR_ORG_NAME,
+            application_name=settings.CASDOOR_APPLICATION_NAME,
+        )
+        self._http: httpx.AsyncClient | None = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._http is None:
+                self._http = httpx.AsyncClient(
+                    base_url=self.sdk.endpoint,
+                    timeout=settings.CASDOOR_TIMEOUT,
+                    limits=httpx.Limits(
+                        max_connections=settings.CASDOOR_MAX_CONNECTIONS
+                    ),
+                )
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._http is not None:
+                await self._http.aclose()
+            self._http = None
+
+    async def client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            await self.start()
+        return self._http
+
+    async def get_oauth_token(self, code: str) -> str | None:
+        client = await self.client()
+        response = await client.post(
+            "/api/login/oauth/access_token",
+            data={
+                "grant_type": "authorization_code",
+                "client_id": self.sdk.client_id,
+                "client_secret": self.sdk.client_secret,
+                "code": code,
+            },
+        )
+        return response.json().get("access_token")
+
+    def parse_jwt_token(self, token: str) -> dict:
+        return jwt.decode(
+            token,
+            _public_key(self.sdk.certificate),
+            algorithms=self.sdk.algorithms,
+            audience=self.sdk.client_id,
+        )
+
+
+casdoor = CasdoorClient()
@@ -0,0 +1,271 @@
+import asyncio
+import os
+import socket
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy import func, update
+
+from storage.config import settings
+from storage.db.models import Content
+from storage.db.models.content import ContentAvailability
+from storage.db.models.ingest import IngestTask, IngestTaskStatus
+from storage.db.session import with_db
+from storage.logging import log
+from storage.services.instant_storage import instant_storage
+from storage.upload import expire_uploads_periodically, process_data_from_origin
+
+
+@dataclass
+class ClaimedTask:
+    id: int
+    tenant_schema: str
+    content_id: int
+    origin: str
+    attempts: int
+
+
+def enqueue_ingest(db, tenant_schema: str, content_id: int, origin: str) -> None:
+    """Add an ingest task within the transaction of the session given, so the task
+    is committed together with its content.
+    """
+
+    db.add(
+        IngestTask(
+            tenant_schema=tenant_schema,
+            content_id=content_id,
+            origin=origin,
+            status=IngestTaskStatus.PENDING,
+            attempts=0,
+        )
+    )
+
+
+def claim_ingest_tasks(limit: int, worker_instance: str) -> list[ClaimedTask]:
+    """Lease up to `limit` available tasks to the worker. Rows locked by other
+    workers are skipped, so concurrent workers never claim the same task.
+    """
+
+    with with_db() as db:
+        tasks: list[IngestTask] = (
+            db.query(IngestTask)
+            .filter(
+                IngestTask.status.in_(
+                    [IngestTaskStatus.PENDING, IngestTaskStatus.PROCESSING]
+                ),
+                IngestTask.run_after <= func.now(),
+            )
+            .order_by(IngestTask.run_after)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        claimed, failed = [], []
+        for task in tasks:
+            if task.attempts >= settings.INGEST_MAX_ATTEMPTS:
+                # the lease of the last attempt expired, its worker is gone
+                task.status = IngestTaskStatus.FAILED
+                task.error = task.error or "lease expired"
+                failed.append((task.tenant_schema, task.content_id))
+                continue
+            task.status = IngestTaskStatus.PROCESSING
+            task.attempts += 1
+            task.run_after = func.now() + timedelta(
+                seconds=settings.INGEST_VISIBILITY_TIMEOUT
+            )
+            task.worker_instance = worker_instance
+            claimed.append(
+                ClaimedTask(
+                    id=task.id,
+                    tenant_schema=task.tenant_schema,
+                    content_id=task.content_id,
+                    origin=task.origin,
+                    attempts=task.attempts,
+                )
+            )
+        db.commit()
+    for tenant_schema, content_id in failed:
+        fail_content(tenant_schema, content_id)
+    return claimed
+
+
+def fail_content(tenant_schema: str, content_id: int) -> None:
+    """Mark content of a task failed for good, so it isn't left pending."""
+
+    with with_db(tenant_schema) as db:
+        db.execute(
+            update(Content)
+            .where(
+                Content.id == content_id,
+                Content.availability == ContentAvailability.PENDING,
+            )
+            .values(availability=ContentAvailability.FAILED)
+        )
+        db.commit()
+
+
+def _update_claimed(task: ClaimedTask, **values) -> bool:
+    """Update the task unless its lease was lost and it was claimed again."""
+
+    with with_db() as db:
+        updated = (
+            db.query(IngestTask)
+            .filter(
+                IngestTask.id == task.id,
+                IngestTask.status == IngestTaskStatus.PROCESSING,
+                IngestTask.attempts == task.attempts,
+            )
+            .update(values, synchronize_session=False)
+        )
+        db.commit()
+    return bool(updated)
+
+
+def extend_lease(task: ClaimedTask) -> bool:
+    return _update_claimed(
+        task,
+        run_after=func.now() + timedelta(seconds=settings.INGEST_VISIBILITY_TIMEOUT),
+    )
+
+
+def complete_ingest_task(task: ClaimedTask) -> None:
+    _update_claimed(task, status=IngestTaskStatus.DONE, error=None)
+
+
+def fail_ingest_task(task: ClaimedTask, error: str) -> None:
+    if task.attempts >= settings.INGEST_MAX_ATTEMPTS:
+        if _update_claimed(task, status=IngestTaskStatus.FAILED, error=error):
+            fail_content(task.tenant_schema, task.content_id)
+        return
+    backoff = min(
+        settings.INGEST_RETRY_BACKOFF * 2 ** (task.attempts - 1),
+        settings.INGEST_RETRY_MAX_BACKOFF,
+    )
+    _update_claimed(
+        task,
+        status=IngestTaskStatus.PENDING,
+        run_after=func.now() + timedelta(seconds=backoff),
+        error=error,
+    )
+
+
+class IngestWorker:
+    """Process ingest tasks from the queue, `INGEST_WORKER_CONCURRENCY` at a time.
+
+    Any number of workers may run against the same database. A claimed task is
+    leased for `INGEST_VISIBILITY_TIMEOUT` seconds and the lease is extended while
+    the task runs, so tasks of a worker that died are picked up by others once
+    their leases expire. Failed tasks are retried with exponential backoff.
+    """
+
+    def __init__(self, concurrency: int):
+        self._concurrency = concurrency
+        self._instance = f"{socket.gethostname()}-{os.getpid()}"[:64]
+        self._running: set[asyncio.Task] = set()
+
+    async def run(self) -> None:
+        log.info(f"starting ingest worker {self._instance}, {self._concurrency=}")
+        try:
+            while True:
+                free = self._concurrency - len(self._running)
+                if not free:
+                    await asyncio.wait(
+                        self._running, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    continue
+                try:
+                    claimed = await asyncio.to_thread(
+                        claim_ingest_tasks, free, self._instance
+                    )
+                except Exception as e:
+                    # e.g. the database is restarting, tasks in flight go on
+                    log.error(f"failed to claim ingest tasks, {e=}")
+                    await asyncio.sleep(settings.INGEST_POLL_INTERVAL)
+                    continue
+                for task in claimed:
+                    running = asyncio.create_task(self._process(task))
+                    self._running.add(running)
+                    running.add_done_callback(self._running.discard)
+                if len(claimed) < free:
+                    # the queue is drained, wait for new tasks
+                    await asyncio.sleep(settings.INGEST_POLL_INTERVAL)
+        finally:
+            for running in self._running:
+                running.cancel()
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _process(self, task: ClaimedTask) -> None:
+        log.debug(f"processing ingest task {task}")
+        processing = asyncio.create_task(
+            process_data_from_origin(
+                origin=task.origin,
+                content_id=task.content_id,
+                tenant_schema=task.tenant_schema,
+            )
+        )
+        heartbeat = asyncio.create_task(self._heartbeat(task))
+        try:
+            await asyncio.wait(
+                [processing, heartbeat], return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            for running in (processing, heartbeat):
+                running.cancel()
+            await asyncio.gather(processing, heartbeat, return_exceptions=True)
+        if not processing.done() or processing.cancelled():
+            # the lease is lost, the task belongs to another worker now
+            log.warning(f"ingest task {task.id} abandoned, its lease is lost")
+            return
+        try:
+            if processing.exception() is not None:
+                e = processing.exception()
+                log.warning(f"ingest task {task.id} failed, {task.attempts=}, {e=}")
+                await asyncio.to_thread(fail_ingest_task, task, repr(e))
+                return
+            await asyncio.to_thread(complete_ingest_task, task)
+        except Exception as e:
+            # the lease expires and the task is retried
+            log.error(f"failed to update ingest task {task.id}, {e=}")
+            return
+        log.debug(f"ingest task {task.id} done")
+
+    async def _heartbeat(self, task: ClaimedTask) -> None:
+        """Extend the lease of the task until it's lost. Failed extensions are
+        retried for as long as the lease lasts.
+        """
+
+        extended_at = time.monotonic()
+        while True:
+            await asyncio.sleep(settings.INGEST_VISIBILITY_TIMEOUT / 3)
+            try:
+                if not await asyncio.to_thread(extend_lease, task):
+                    log.warning(f"lost lease of ingest task {task.id}")
+                    return
+                extended_at = time.monotonic()
+            except Exception as e:
+                log.error(f"failed to extend lease of ingest task {task.id}, {e=}")
+                if time.monotonic() - extended_at >= settings.INGEST_VISIBILITY_TIMEOUT:
+                    log.warning(f"lease of ingest task {task.id} expired")
+                    return
+
+
+async def run_ingest_worker() -> None:
+    """Process ingest tasks and sweep abandoned uploads until cancelled, instant
+    storage has to be started.
+    """
+
+    expiring = asyncio.create_task(expire_uploads_periodically())
+    try:
+        await IngestWorker(settings.INGEST_WORKER_CONCURRENCY).run()
+    finally:
+        expiring.cancel()
+        await asyncio.gather(expiring, return_exceptions=True)
+
+
+async def start_ingest_worker() -> None:
+    await instant_storage.start()
+    try:
+        await run_ingest_worker()
+    finally:
+        await instant_storage.close()
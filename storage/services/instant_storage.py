@@ -1,43 +1,351 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import AsyncIterable
+
 import aioboto3
+from aiobotocore.config import AioConfig
+from botocore.exceptions import ClientError
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential
 
 from storage.config import settings
+from storage.logging import log
+from storage.services.presigner import presigner
 
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024  # but the last part
+MULTIPART_COPY_PART_SIZE = 512 * 1024 * 1024
+MAX_COPY_OBJECT_SIZE = 5 * 1024 * 1024 * 1024  # 5GiB, single CopyObject limit
 
-async def upload_data_to_instant_storage(data, ipfs_cid: str):
-    async with aioboto3.Session().client(
-        service_name="s3",
-        region_name=settings.INSTANT_STORAGE_REGION,
-        endpoint_url=settings.INSTANT_STORAGE_ENDPOINT,
-        aws_access_key_id=settings.INSTANT_STORAGE_ACCESS_KEY,
-        aws_secret_access_key=settings.INSTANT_STORAGE_SECRET_ACCESS_KEY,
-    ) as s3:
-        await s3.put_object(
-            Bucket=settings.INSTANT_STORAGE_BUCKET_NAME, Key=f"{ipfs_cid}", Body=data
+
+class InstantStorageClient:
+    """Long-lived S3 client shared by all the requests.
+
+    The web application starts and closes it with its lifespan. Other entry points
+    get it started on the first use.
+    """
+
+    def __init__(self):
+        self._exit_stack: AsyncExitStack | None = None
+        self._s3 = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._s3 is not None:
+                return
+            exit_stack = AsyncExitStack()
+            self._s3 = await exit_stack.enter_async_context(
+                aioboto3.Session().client(
+                    service_name="s3",
+                    region_name=settings.INSTANT_STORAGE_REGION,
+                    endpoint_url=settings.INSTANT_STORAGE_ENDPOINT,
+                    aws_access_key_id=settings.INSTANT_STORAGE_ACCESS_KEY,
+                    aws_secret_access_key=settings.INSTANT_STORAGE_SECRET_ACCESS_KEY,
+                    config=AioConfig(
+                        max_pool_connections=(
+                            settings.INSTANT_STORAGE_MAX_POOL_CONNECTIONS
+                        ),
+                    ),
+                )
+            )
+            self._exit_stack = exit_stack
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._exit_stack is not None:
+                await self._exit_stack.aclose()
+            self._exit_stack = None
+            self._s3 = None
+
+    async def client(self):
+        if self._s3 is None:
+            await self.start()
+        return self._s3
+
+
+instant_storage = InstantStorageClient()
+
+
+def _retrying() -> AsyncRetrying:
+    return AsyncRetrying(
+        stop=stop_after_attempt(settings.INSTANT_STORAGE_PART_ATTEMPTS),
+        wait=wait_exponential(multiplier=0.5, max=10),
+        reraise=True,
+    )
+
+
+class MultipartUpload:
+    """S3 multipart upload sending parts concurrently.
+
+    Scheduling a part waits while `INSTANT_STORAGE_MAX_PARTS_IN_FLIGHT` parts are
+    being sent, so memory is bounded by that number of parts. Every part is retried
+    on its own. The upload is completed on a successful exit from the context and
+    aborted otherwise, so failed uploads don't leave orphaned parts behind.
+    """
+
+    def __init__(self, s3, key: str):
+        self._s3 = s3
+        self._key = key
+        self._bucket = settings.INSTANT_STORAGE_BUCKET_NAME
+        self._upload_id = None
+        self._in_flight = asyncio.Semaphore(
+            settings.INSTANT_STORAGE_MAX_PARTS_IN_FLIGHT
         )
+        self._tasks: list[asyncio.Task] = []
+        self._etags: dict[int, str] = {}
 
+    async def __aenter__(self):
+        upload = await self._s3.create_multipart_upload(
+            Bucket=self._bucket, Key=self._key
+        )
+        self._upload_id = upload["UploadId"]
+        return self
 
-async def generate_access_link_for_instant_storage_data(ipfs_cid: str, filename: str):
-    expires_in = 3600
-    async with aioboto3.Session().client(
-        service_name="s3",
-        region_name=settings.INSTANT_STORAGE_REGION,
-        endpoint_url=settings.INSTANT_STORAGE_ENDPOINT,
-        aws_access_key_id=settings.INSTANT_STORAGE_ACCESS_KEY,
-        aws_secret_access_key=settings.INSTANT_STORAGE_SECRET_ACCESS_KEY,
-    ) as s3:
-        add_params = {}
-        if filename:
-            add_params = {
-                "ResponseContentDisposition": f"attachment; filename={filename}"
-            }
-
-        res = await s3.generate_presigned_url(
-            ClientMethod="get_object",
-            Params={
-                "Bucket": settings.INSTANT_STORAGE_BUCKET_NAME,
-                "Key": f"{ipfs_cid}",
-                **add_params,
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            try:
+                await self._complete()
+                return
+            except BaseException:
+                await self._abort()
+                raise
+        await self._abort()
+
+    async def upload_part(self, body: bytes) -> None:
+        await self._schedule(self._s3.upload_part, Body=body)
+
+    async def copy_part(self, copy_source: dict, start: int, end: int) -> None:
+        await self._schedule(
+            self._s3.upload_part_copy,
+            CopySource=copy_source,
+            CopySourceRange=f"bytes={start}-{end}",
+        )
+
+    async def _schedule(self, method, **kwargs) -> None:
+        await self._in_flight.acquire()
+        for task in self._tasks:
+            if task.done() and task.exception():
+                self._in_flight.release()
+                raise task.exception()
+        part_number = len(self._tasks) + 1
+        self._tasks.append(asyncio.create_task(self._send(part_number, method, kwargs)))
+
+    async def _send(self, part_number: int, method, kwargs: dict) -> None:
+        try:
+            async for attempt in _retrying():
+                with attempt:
+                    if attempt.retry_state.attempt_number > 1:
+                        log.warning(f"retrying part {part_number} of {self._key}")
+                    response = await method(
+                        Bucket=self._bucket,
+                        Key=self._key,
+                        UploadId=self._upload_id,
+                        PartNumber=part_number,
+                        **kwargs,
+                    )
+        finally:
+            self._in_flight.release()
+        if "CopyPartResult" in response:
+            self._etags[part_number] = response["CopyPartResult"]["ETag"]
+        else:
+            self._etags[part_number] = response["ETag"]
+
+    async def _complete(self) -> None:
+        await asyncio.gather(*self._tasks)
+        await self._s3.complete_multipart_upload(
+            Bucket=self._bucket,
+            Key=self._key,
+            UploadId=self._upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": part_number, "ETag": self._etags[part_number]}
+                    for part_number in sorted(self._etags)
+                ]
             },
-            ExpiresIn=expires_in,
         )
-        return res, expires_in
+
+    async def _abort(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._s3.abort_multipart_upload(
+            Bucket=self._bucket, Key=self._key, UploadId=self._upload_id
+        )
+
+
+async def start_multipart_upload(key: str) -> str:
+    s3 = await instant_storage.client()
+    upload = await s3.create_multipart_upload(
+        Bucket=settings.INSTANT_STORAGE_BUCKET_NAME, Key=key
+    )
+    return upload["UploadId"]
+
+
+async def upload_multipart_part(
+    key: str, upload_id: str, part_number: int, body: bytes
+) -> str:
+    s3 = await instant_storage.client()
+    async for attempt in _retrying():
+        with attempt:
+            part = await s3.upload_part(
+                Bucket=settings.INSTANT_STORAGE_BUCKET_NAME,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=body,
+            )
+    return part["ETag"]
+
+
+async def complete_multipart_upload(key: str, upload_id: str, etags: list[str]):
+    s3 = await instant_storage.client()
+    if not etags:
+        # multipart upload can't be completed without parts, the object is written
+        # first, so it's there once the upload is gone
+        await s3.put_object(
+            Bucket=settings.INSTANT_STORAGE_BUCKET_NAME, Key=key, Body=b""
+        )
+        await abort_multipart_upload(key, upload_id)
+        return
+    await s3.complete_multipart_upload(
+        Bucket=settings.INSTANT_STORAGE_BUCKET_NAME,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": [
+                {"PartNumber": part_number, "ETag": etag}
+                for part_number, etag in enumerate(etags, start=1)
+            ]
+        },
+    )
+
+
+async def abort_multipart_upload(key: str, upload_id: str):
+    s3 = await instant_storage.client()
+    await s3.abort_multipart_upload(
+        Bucket=settings.INSTANT_STORAGE_BUCKET_NAME, Key=key, UploadId=upload_id
+    )
+
+
+async def upload_stream_to_instant_storage(chunks: AsyncIterable[bytes], key: str):
+    """Write a stream of chunks to the object under the given key. Returns the
+    object size. Streams shorter than a part are written with a single request.
+    """
+
+    part_size = settings.INSTANT_STORAGE_PART_SIZE
+    chunks = aiter(chunks)
+    buffer = bytearray()
+    s3 = await instant_storage.client()
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= part_size:
+            break
+    else:
+        await s3.put_object(
+            Bucket=settings.INSTANT_STORAGE_BUCKET_NAME, Key=key, Body=bytes(buffer)
+        )
+        return len(buffer)
+
+    size = len(buffer)
+    async with MultipartUpload(s3, key) as upload:
+        while True:
+            while len(buffer) >= part_size:
+                await upload.upload_part(bytes(buffer[:part_size]))
+                del buffer[:part_size]
+            chunk = await anext(chunks, None)
+            if chunk is None:
+                break
+            buffer += chunk
+            size += len(chunk)
+        if buffer:
+            await upload.upload_part(bytes(buffer))
+    return size
+
+
+async def move_instant_storage_object(source_key: str, key: str, size: int):
+    """Move an object server-side, so the data doesn't cross the wire again."""
+
+    bucket = settings.INSTANT_STORAGE_BUCKET_NAME
+    copy_source = {"Bucket": bucket, "Key": source_key}
+    s3 = await instant_storage.client()
+    if size <= MAX_COPY_OBJECT_SIZE:
+        await s3.copy_object(Bucket=bucket, Key=key, CopySource=copy_source)
+    else:
+        async with MultipartUpload(s3, key) as upload:
+            for start in range(0, size, MULTIPART_COPY_PART_SIZE):
+                end = min(start + MULTIPART_COPY_PART_SIZE, size) - 1
+                await upload.copy_part(copy_source, start, end)
+    await s3.delete_object(Bucket=bucket, Key=source_key)
+
+
+async def instant_storage_object_exists(key: str) -> bool:
+    s3 = await instant_storage.client()
+    try:
+        await s3.head_object(Bucket=settings.INSTANT_STORAGE_BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            return False
+        raise
+    return True
+
+
+async def delete_instant_storage_object(key: str):
+    s3 = await instant_storage.client()
+    await s3.delete_object(Bucket=settings.INSTANT_STORAGE_BUCKET_NAME, Key=key)
+
+
+class AccessLinkCache:
+    """LRU cache of presigned download links. A link is handed out again while it
+    stays valid for at least `INSTANT_STORAGE_LINK_MIN_EXPIRES_IN` seconds.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._links: OrderedDict[tuple, tuple[str, float]] = OrderedDict()
+
+    def get(self, key: tuple) -> tuple[str, int] | None:
+        link = self._links.get(key)
+        if link is None:
+            return None
+        url, expires_at = link
+        expires_in = int(expires_at - time.time())
+        if expires_in < settings.INSTANT_STORAGE_LINK_MIN_EXPIRES_IN:
+            del self._links[key]
+            return None
+        self._links.move_to_end(key)
+        return url, expires_in
+
+    def put(self, key: tuple, url: str, expires_at: float) -> None:
+        self._links[key] = (url, expires_at)
+        self._links.move_to_end(key)
+        if len(self._links) > self._max_size:
+            self._links.popitem(last=False)
+
+
+access_links = AccessLinkCache(settings.INSTANT_STORAGE_LINK_CACHE_SIZE)
+
+
+async def generate_access_link_for_instant_storage_data(ipfs_cid: str, filename: str):
+    cached = access_links.get((ipfs_cid, filename))
+    if cached:
+        return cached
+
+    expires_in = settings.INSTANT_STORAGE_LINK_EXPIRES_IN
+    add_params = {}
+    if filename:
+        add_params = {
+            "response-content-disposition": f"attachment; filename={filename}"
+        }
+
+    now = time.time()
+    res = presigner.presign_get_object(
+        bucket=settings.INSTANT_STORAGE_BUCKET_NAME,
+        key=f"{ipfs_cid}",
+        expires_in=expires_in,
+        params=add_params,
+        now=datetime.fromtimestamp(now, tz=timezone.utc),
+    )
+    access_links.put((ipfs_cid, filename), res, now + expires_in)
+    return res, expires_in
@@ -0,0 +1,105 @@
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+
+from storage.config import settings
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+class SigV4Presigner:
+    """AWS Signature Version 4 query string signing of path-style S3 GET requests.
+
+    Signs in-process without an S3 client. The signing key depends on the date
+    only, so it's derived once a day and reused.
+    """
+
+    def __init__(
+        self, endpoint: str, region: str, access_key: str, secret_key: str
+    ) -> None:
+        url = urlsplit(endpoint)
+        self._scheme = url.scheme
+        self._host = url.netloc
+        self._path = url.path.rstrip("/")
+        self._region = region
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._signing_key_date: str | None = None
+        self._signing_key = b""
+
+    def _get_signing_key(self, date: str) -> bytes:
+        if self._signing_key_date != date:
+            key = _hmac(f"AWS4{self._secret_key}".encode(), date)
+            key = _hmac(key, self._region)
+            key = _hmac(key, "s3")
+            self._signing_key = _hmac(key, "aws4_request")
+            self._signing_key_date = date
+        return self._signing_key
+
+    def presign_get_object(
+        self,
+        bucket: str,
+        key: str,
+        expires_in: int,
+        params: dict[str, str] | None = None,
+        now: datetime | None = None,
+    ) -> str:
+        now = now or datetime.now(tz=timezone.utc)
+        timestamp = now.strftime("%Y%m%dT%H%M%SZ")
+        date = timestamp[:8]
+        scope = f"{date}/{self._region}/s3/aws4_request"
+        path = quote(f"{self._path}/{bucket}/{key}", safe="/~")
+        query = {
+            **(params or {}),
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": f"{self._access_key}/{scope}",
+            "X-Amz-Date": timestamp,
+            "X-Amz-Expires": str(expires_in),
+            "X-Amz-SignedHeaders": "host",
+        }
+        canonical_query = "&".join(
+            f"{name}={value}"
+            for name, value in sorted(
+                (quote(name, safe="~"), quote(value, safe="~"))
+                for name, value in query.items()
+            )
+        )
+        canonical_request = "\n".join(
+            [
+                "GET",
+                path,
+                canonical_query,
+                f"host:{self._host}",
+                "",
+                "host",
+                "UNSIGNED-PAYLOAD",
+            ]
+        )
+        string_to_sign = "\n".join(
+            [
+                ALGORITHM,
+                timestamp,
+                scope,
+                hashlib.sha256(canonical_request.encode()).hexdigest(),
+            ]
+        )
+        signature = hmac.new(
+            self._get_signing_key(date), string_to_sign.encode(), hashlib.sha256
+        ).hexdigest()
+        return (
+            f"{self._scheme}://{self._host}{path}"
+            f"?{canonical_query}&X-Amz-Signature={signature}"
+        )
+
+
+presigner = SigV4Presigner(
+    endpoint=settings.INSTANT_STORAGE_ENDPOINT,
+    region=settings.INSTANT_STORAGE_REGION,
+    access_key=settings.INSTANT_STORAGE_ACCESS_KEY,
+    secret_key=settings.INSTANT_STORAGE_SECRET_ACCESS_KEY,
+)
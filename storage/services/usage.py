@@ -0,0 +1,110 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from storage.db.models import Content
+from storage.db.models.tenant import Tenant
+from storage.db.models.usage import TenantUsage, UserUsage
+from storage.db.session import with_async_db
+from storage.logging import log
+
+
+def _add_to_counters(table, key: dict, contents_number: int, contents_size: int):
+    statement = insert(table).values(
+        **key, contents_number=contents_number, contents_size=contents_size
+    )
+    return statement.on_conflict_do_update(
+        index_elements=list(key),
+        set_=dict(
+            contents_number=table.contents_number + statement.excluded.contents_number,
+            contents_size=table.contents_size + statement.excluded.contents_size,
+        ),
+    )
+
+
+async def record_usage(
+    db,
+    tenant_schema: str,
+    owner_id: int,
+    contents_number: int = 0,
+    contents_size: int = 0,
+) -> None:
+    """Add to the usage counters of the owner and the tenant within the transaction
+    of the session given, so the counters change together with the contents.
+
+    The tenant counter is locked first, the same order `reconcile_usage` takes.
+    """
+
+    await db.execute(
+        _add_to_counters(
+            TenantUsage,
+            dict(tenant_schema=tenant_schema),
+            contents_number,
+            contents_size,
+        )
+    )
+    await db.execute(
+        _add_to_counters(
+            UserUsage, dict(owner_id=owner_id), contents_number, contents_size
+        )
+    )
+
+
+async def reconcile_usage(tenant_schema: str) -> None:
+    """Recount the usage counters of the tenant from its contents, repairing drift.
+
+    The tenant counter stays locked during the recount, so contents changed
+    concurrently add to the counters after the recount and not before it.
+    """
+
+    async with with_async_db(tenant_schema) as db:
+        # adding nothing takes the lock
+        await db.execute(
+            _add_to_counters(TenantUsage, dict(tenant_schema=tenant_schema), 0, 0)
+        )
+        rows = (
+            await db.execute(
+                select(
+                    Content.owner_id,
+                    func.count(Content.id),
+                    func.coalesce(func.sum(Content.ipfs_file_size), 0),
+                )
+                .filter(Content.owner_id.isnot(None))
+                .group_by(Content.owner_id)
+            )
+        ).all()
+        counted = {owner_id: (number, size) for owner_id, number, size in rows}
+        usages = (await db.scalars(select(UserUsage))).all()
+        for usage in usages:
+            number, size = counted.pop(usage.owner_id, (0, 0))
+            if (usage.contents_number, usage.contents_size) != (number, size):
+                log.warning(
+                    f"usage drift, {tenant_schema=}, {usage.owner_id=}, "
+                    f"{usage.contents_number=}, {usage.contents_size=}, "
+                    f"{number=}, {size=}"
+                )
+                usage.contents_number = number
+                usage.contents_size = size
+        for owner_id, (number, size) in counted.items():
+            log.warning(f"usage drift, {tenant_schema=}, {owner_id=} uncounted")
+            db.add(
+                UserUsage(owner_id=owner_id, contents_number=number, contents_size=size)
+            )
+        await db.execute(
+            update(TenantUsage)
+            .filter(TenantUsage.tenant_schema == tenant_schema)
+            .values(
+                contents_number=select(func.count(Content.id)).scalar_subquery(),
+                contents_size=select(
+                    func.coalesce(func.sum(Content.ipfs_file_size), 0)
+                ).scalar_subquery(),
+            )
+        )
+        await db.commit()
+
+
+async def reconcile_all_usage() -> None:
+    async with with_async_db() as db:
+        schemas = (await db.scalars(select(Tenant.schema))).all()
+    for tenant_schema in schemas:
+        await reconcile_usage(tenant_schema)
+    log.info(f"usage reconciled, {len(schemas)=}")
@@ -0,0 +1,162 @@
+"""In-process IPFS content identifiers computation.
+
+Reproduces `ipfs add --cid-version=1` of kubo with default settings: fixed size
+chunker with 256KiB chunks, raw leaves, balanced DAG layout with up to 174 links
+per node and sha2-256 hashing. The DAG itself is never kept, only the links
+of the nodes under construction, so memory usage doesn't depend on data size.
+"""
+
+
+import hashlib
+from base64 import b32encode
+
+CHUNK_SIZE = 262144
+MAX_LINKS = 174
+
+CODEC_RAW = 0x55
+CODEC_DAG_PB = 0x70
+MULTIHASH_SHA2_256 = 0x12
+UNIXFS_FILE = 2
+
+
+def _varint(value: int) -> bytes:
+    result = bytearray()
+    while value > 0x7F:
+        result.append(value & 0x7F | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def _uint_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+def _bytes_field(number: int, value: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def _cid(codec: int, block: bytes) -> bytes:
+    digest = hashlib.sha256(block).digest()
+    return bytes([1, codec, MULTIHASH_SHA2_256, len(digest)]) + digest
+
+
+def encode_cid(cid: bytes) -> str:
+    """Encode binary CID to base32 multibase string form, e.g. `bafy...`."""
+
+    return "b" + b32encode(cid).decode().lower().rstrip("=")
+
+
+class Link:
+    __slots__ = ("cid", "tsize", "filesize")
+
+    def __init__(self, cid: bytes, tsize: int, filesize: int):
+        self.cid = cid
+        self.tsize = tsize  # cumulative size of the linked DAG
+        self.filesize = filesize  # size of the file data the DAG holds
+
+
+def _encode_node(links: list[Link]) -> bytes:
+    """Encode dag-pb node of UnixFS file with the given children the same way
+    go-merkledag does: links first, always with a name and a size, then data.
+    """
+
+    data = _uint_field(1, UNIXFS_FILE)
+    data += _uint_field(3, sum(link.filesize for link in links))
+    data += b"".join(_uint_field(4, link.filesize) for link in links)
+    node = b"".join(
+        _bytes_field(
+            2,
+            _bytes_field(1, link.cid)
+            + _bytes_field(2, b"")
+            + _uint_field(3, link.tsize),
+        )
+        for link in links
+    )
+    return node + _bytes_field(1, data)
+
+
+class UnixFSHasher:
+    """Incremental UnixFS file DAG builder computing the root CID and the DAG
+    size reported by kubo for the data fed with `update`.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._levels: list[list[Link]] = [[]]  # incomplete nodes, leaves first
+
+    def update(self, data: bytes) -> None:
+        self._buffer += data
+        offset = 0
+        while len(self._buffer) - offset >= CHUNK_SIZE:
+            self._add_leaf(bytes(self._buffer[offset : offset + CHUNK_SIZE]))
+            offset += CHUNK_SIZE
+        del self._buffer[:offset]
+
+    def get_state(self) -> dict:
+        """Serializable hasher state, for hashing to continue in another process.
+        Only whole chunks must be fed so far.
+        """
+
+        if self._buffer:
+            raise ValueError("data fed isn't a multiple of the chunk size")
+        return {
+            "levels": [
+                [[link.cid.hex(), link.tsize, link.filesize] for link in links]
+                for links in self._levels
+            ]
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "UnixFSHasher":
+        hasher = cls()
+        hasher._levels = [
+            [
+                Link(bytes.fromhex(cid), tsize, filesize)
+                for cid, tsize, filesize in links
+            ]
+            for links in state["levels"]
+        ]
+        return hasher
+
+    def digest(self) -> tuple[str, int]:
+        """Finish the DAG. Returns the root CID and the DAG size."""
+
+        if self._buffer or not self._levels[0]:
+            self._add_leaf(bytes(self._buffer))
+            self._buffer.clear()
+        level = 0
+        while level < len(self._levels) - 1 or len(self._levels[level]) > 1:
+            self._push(level + 1, self._collapse(self._levels[level]))
+            self._levels[level] = []
+            level += 1
+        (root,) = self._levels[level]
+        return encode_cid(root.cid), root.tsize
+
+    def _add_leaf(self, chunk: bytes) -> None:
+        self._push(0, Link(_cid(CODEC_RAW, chunk), len(chunk), len(chunk)))
+
+    def _push(self, level: int, link: Link) -> None:
+        # a node is completed only when there is more data to be placed after it,
+        # the same way the balanced layout fills nodes depth-first
+        if level == len(self._levels):
+            self._levels.append([])
+        if len(self._levels[level]) == MAX_LINKS:
+            self._push(level + 1, self._collapse(self._levels[level]))
+            self._levels[level] = []
+        self._levels[level].append(link)
+
+    @staticmethod
+    def _collapse(links: list[Link]) -> Link:
+        node = _encode_node(links)
+        return Link(
+            _cid(CODEC_DAG_PB, node),
+            len(node) + sum(link.tsize for link in links),
+            sum(link.filesize for link in links),
+        )
+
+
+def compute_cid(data: bytes) -> tuple[str, int]:
+    hasher = UnixFSHasher()
+    hasher.update(data)
+    return hasher.digest()
@@ -1,36 +1,363 @@
-import io
+import asyncio
+import uuid
+from collections import deque
+from datetime import timedelta
+from typing import AsyncIterable, AsyncIterator
 
 import httpx
+from botocore.exceptions import ClientError
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.dialects.postgresql import insert
+from tenacity import AsyncRetrying, stop_after_attempt, wait_exponential
 
 from storage.config import settings
-from storage.db.models import Content
+from storage.db.models import Content, Upload
 from storage.db.models.content import ContentAvailability
+from storage.db.models.instant_storage import InstantStorageObject
+from storage.db.models.tenant import Tenant
+from storage.db.session import with_async_db
 from storage.logging import log
-from storage.services.instant_storage import upload_data_to_instant_storage
+from storage.services.instant_storage import (
+    abort_multipart_upload,
+    delete_instant_storage_object,
+    instant_storage_object_exists,
+    move_instant_storage_object,
+    upload_stream_to_instant_storage,
+)
+from storage.services.usage import record_usage
+from storage.unixfs import UnixFSHasher
 
+CHUNK_SIZE = 1024 * 1024  # 1MiB
+PIPELINE_DEPTH = 4  # chunks buffered per pipeline stage
+
+
+async def iter_file(file, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+async def is_stored(ipfs_cid: str) -> bool:
+    """Check the data is in instant storage already. The index alone isn't trusted,
+    as the storage lifecycle removes objects, so the object is looked up in the
+    storage itself: stale entries are dropped and objects stored before the index
+    existed are indexed on the way.
+    """
+
+    async with with_async_db() as db:
+        indexed = await db.scalar(
+            select(exists().where(InstantStorageObject.ipfs_cid == ipfs_cid))
+        )
+    stored = await instant_storage_object_exists(ipfs_cid)
+    if indexed and not stored:
+        log.debug(f"dropping stale instant storage index entry {ipfs_cid=}")
+        async with with_async_db() as db:
+            await db.execute(
+                delete(InstantStorageObject).where(
+                    InstantStorageObject.ipfs_cid == ipfs_cid
+                )
+            )
+            await db.commit()
+    elif stored and not indexed:
+        await mark_stored(ipfs_cid, size=None)
+    return stored
+
+
+async def mark_stored(ipfs_cid: str, size: int | None) -> None:
+    async with with_async_db() as db:
+        await db.execute(
+            insert(InstantStorageObject)
+            .values(ipfs_cid=ipfs_cid, size=size)
+            .on_conflict_do_nothing()
+        )
+        await db.commit()
+
+
+async def compute_ipfs_cid(chunks: AsyncIterable[bytes]) -> tuple[str, int]:
+    """Compute CID and DAG size the IPFS node would give for the chunks. Hashing
+    runs in a worker thread to keep the event loop responsive.
+    """
+
+    hasher = UnixFSHasher()
+    async for chunk in chunks:
+        await asyncio.to_thread(hasher.update, chunk)
+    return await asyncio.to_thread(hasher.digest)
+
+
+async def _fan_out(chunks: AsyncIterable[bytes], *queues: asyncio.Queue) -> None:
+    async for chunk in chunks:
+        for queue in queues:
+            await queue.put(chunk)
+    for queue in queues:
+        await queue.put(None)
+
+
+async def _drain(queue: asyncio.Queue) -> AsyncIterator[bytes]:
+    while (chunk := await queue.get()) is not None:
+        yield chunk
+
+
+async def _gather(*tasks: asyncio.Task) -> list:
+    """Wait for all the tasks, cancelling the rest as soon as one of them fails."""
+
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception():
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+async def promote(upload_key: str, ipfs_cid: str, size: int) -> None:
+    """Make an object written under a temporary key available under its CID."""
+
+    if await is_stored(ipfs_cid):
+        log.debug(f"duplicate, dropping {upload_key=}, {ipfs_cid=}")
+        await delete_instant_storage_object(upload_key)
+        return
+    await move_instant_storage_object(upload_key, ipfs_cid, size)
+    await mark_stored(ipfs_cid, size)
+
+
+async def ingest(chunks: AsyncIterable[bytes]) -> tuple[str, int]:
+    """Read the chunks once, feeding the CID hasher and instant storage at the same
+    time. Returns the CID and the DAG size.
+
+    The CID is known only when the stream ends, so the data is written under
+    a temporary key and moved to the CID key server-side. Memory stays bounded by
+    the stage queues and a single storage part regardless of the data size.
+    """
+
+    hashing_queue = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+    storing_queue = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+    upload_key = f"uploads/{uuid.uuid4()}"
+    storing = asyncio.create_task(
+        upload_stream_to_instant_storage(_drain(storing_queue), key=upload_key)
+    )
+    tasks = [
+        asyncio.create_task(_fan_out(chunks, hashing_queue, storing_queue)),
+        asyncio.create_task(compute_ipfs_cid(_drain(hashing_queue))),
+        storing,
+    ]
+    try:
+        _, (ipfs_cid, ipfs_file_size), size = await _gather(*tasks)
+    except BaseException:
+        if storing.done() and not storing.cancelled() and not storing.exception():
+            await delete_instant_storage_object(upload_key)
+        raise
+    log.debug(f"ingested {upload_key=}, {ipfs_cid=}, {size=}")
+    await promote(upload_key, ipfs_cid, size)
+    return ipfs_cid, ipfs_file_size
+
+
+async def ingest_file(file) -> tuple[str, int]:
+    """Ingest an uploaded file, reading it once. Files up to
+    `UPLOAD_HASH_FIRST_MAX_SIZE` are kept in memory and hashed before anything is
+    sent, so data already in instant storage isn't uploaded again, larger ones are
+    hashed and stored at the same time, see `ingest`.
+    """
+
+    head = await file.read(settings.UPLOAD_HASH_FIRST_MAX_SIZE + 1)
+    if len(head) > settings.UPLOAD_HASH_FIRST_MAX_SIZE:
+        return await ingest(_prepend(head, iter_file(file)))
+
+    ipfs_cid, ipfs_file_size = await compute_ipfs_cid(_prepend(head))
+    if await is_stored(ipfs_cid):
+        log.debug(f"duplicate, skipping upload {ipfs_cid=}")
+        return ipfs_cid, ipfs_file_size
+    size = await upload_stream_to_instant_storage(_prepend(head), key=ipfs_cid)
+    await mark_stored(ipfs_cid, size)
+    return ipfs_cid, ipfs_file_size
+
+
+async def _prepend(
+    head: bytes, chunks: AsyncIterable[bytes] | None = None
+) -> AsyncIterator[bytes]:
+    if head:
+        yield head
+    if chunks is not None:
+        async for chunk in chunks:
+            yield chunk
+
+
+async def ingest_files(files: list) -> list[tuple[str, int] | Exception]:
+    """Ingest many files, `UPLOAD_BATCH_CONCURRENCY` at a time. Returns the CID and
+    the DAG size of every file in the same order, or the error it failed with.
+    """
+
+    semaphore = asyncio.Semaphore(settings.UPLOAD_BATCH_CONCURRENCY)
+
+    async def ingest_one(file) -> tuple[str, int]:
+        async with semaphore:
+            return await ingest_file(file)
+
+    results = await asyncio.gather(
+        *(ingest_one(file) for file in files), return_exceptions=True
+    )
+    for file, result in zip(files, results):
+        if isinstance(result, Exception):
+            log.error(f"failed to ingest {file.filename}: {result!r}")
+    return results
+
+
+def upload_expiry():
+    """Expiry of an upload continued now, as an SQL expression."""
+
+    return func.now() + timedelta(seconds=settings.UPLOAD_EXPIRES_IN)
+
+
+async def discard_upload(key: str, upload_id: str) -> None:
+    """Drop the parts of a resumable upload, or the object assembled of them if
+    its completion got that far.
+    """
+
+    try:
+        await abort_multipart_upload(key, upload_id)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchUpload":
+            raise
+        await delete_instant_storage_object(key)
+
+
+async def expire_uploads() -> int:
+    """Abort uploads of all the tenants not continued for `UPLOAD_EXPIRES_IN`
+    seconds, so their parts don't pile up in instant storage. An upload is
+    deleted before its multipart upload is aborted, so one resumed meanwhile is
+    never aborted. Returns the number of uploads expired.
+    """
+
+    async with with_async_db() as db:
+        schemas = (await db.scalars(select(Tenant.schema))).all()
+    expired = 0
+    for schema in schemas:
+        async with with_async_db(schema) as db:
+            uploads = (
+                await db.execute(
+                    delete(Upload)
+                    .where(Upload.expires_at <= func.now())
+                    .returning(Upload.id, Upload.key, Upload.upload_id)
+                )
+            ).all()
+            await db.commit()
+        for upload in uploads:
+            log.info(f"upload expired, {schema=}, {upload.id=}")
+            try:
+                await discard_upload(upload.key, upload.upload_id)
+            except ClientError as e:
+                log.error(f"failed to abort expired upload {upload.key}, {e=}")
+        expired += len(uploads)
+    return expired
+
+
+async def expire_uploads_periodically() -> None:
+    while True:
+        try:
+            await expire_uploads()
+        except Exception as e:
+            log.error(f"failed to expire uploads, {e=}")
+        await asyncio.sleep(settings.UPLOAD_EXPIRY_INTERVAL)
+
+
+async def _fetch_range(client: httpx.AsyncClient, origin: str, start: int, end: int):
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(settings.ORIGIN_RANGE_ATTEMPTS),
+        wait=wait_exponential(multiplier=0.5, max=10),
+        reraise=True,
+    ):
+        with attempt:
+            r = await client.get(origin, headers={"Range": f"bytes={start}-{end}"})
+            r.raise_for_status()
+            if (
+                r.status_code != httpx.codes.PARTIAL_CONTENT
+                or len(r.content) != end - start + 1
+            ):
+                raise ValueError(f"bad range {start}-{end} of {origin}")
+    return r.content
+
+
+async def _iter_ranges(
+    client: httpx.AsyncClient, origin: str, size: int
+) -> AsyncIterator[bytes]:
+    """Download ranges of the origin concurrently, yielding the data in order.
+    At most `ORIGIN_MAX_RANGES_IN_FLIGHT` ranges are held in memory.
+    """
+
+    range_size = settings.ORIGIN_RANGE_SIZE
+    pending: deque[asyncio.Task] = deque()
+    try:
+        for start in range(0, size, range_size):
+            end = min(start + range_size, size) - 1
+            pending.append(
+                asyncio.create_task(_fetch_range(client, origin, start, end))
+            )
+            if len(pending) < settings.ORIGIN_MAX_RANGES_IN_FLIGHT:
+                continue
+            data = await pending.popleft()
+            for offset in range(0, len(data), CHUNK_SIZE):
+                yield data[offset : offset + CHUNK_SIZE]
+        while pending:
+            data = await pending.popleft()
+            for offset in range(0, len(data), CHUNK_SIZE):
+                yield data[offset : offset + CHUNK_SIZE]
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def iter_origin(origin: str) -> AsyncIterator[bytes]:
+    """Stream the data of the origin URL in chunks. Large origins serving byte
+    ranges are downloaded with parallel range requests, other ones with a single
+    streamed request.
+    """
 
-async def process_data_from_origin(origin: str, content_id: int, db) -> None:
-    log.debug(f"fetching content {content_id} {origin}")
-    async with httpx.AsyncClient() as client:
-        r = await client.get(origin)
-        content_file = io.BytesIO(r.content)
     async with httpx.AsyncClient(
-        base_url=settings.IPFS_HTTP_PROVIDER,
+        follow_redirects=True, timeout=settings.ORIGIN_TIMEOUT
     ) as client:
-        response = await client.post(
-            "/api/v0/add",
-            params={"cid-version": 1, "only-hash": True},
-            files={"upload-files": content_file},
+        async with client.stream("GET", origin) as r:
+            r.raise_for_status()
+            size = int(r.headers.get("content-length", 0))
+            ranged = (
+                r.headers.get("accept-ranges") == "bytes"
+                and "content-encoding" not in r.headers
+                and size >= settings.ORIGIN_RANGE_MIN_SIZE
+            )
+            if not ranged:
+                async for chunk in r.aiter_bytes(CHUNK_SIZE):
+                    yield chunk
+                return
+        # the body of the probing request is left unread, closing it drops
+        # the connection after the headers
+        log.debug(f"fetching {origin} with range requests, {size=}")
+        async for chunk in _iter_ranges(client, origin, size):
+            yield chunk
+
+
+async def process_data_from_origin(
+    origin: str, content_id: int, tenant_schema: str
+) -> None:
+    log.debug(f"fetching content {content_id} {origin}")
+    ipfs_cid, ipfs_file_size = await ingest(iter_origin(origin))
+
+    async with with_async_db(tenant_schema) as db:
+        content: Content | None = await db.get(Content, content_id)
+        if not content:
+            log.warning(f"content {content_id} was deleted while being fetched")
+            return
+        await record_usage(
+            db,
+            tenant_schema,
+            content.owner_id,
+            contents_size=ipfs_file_size - (content.ipfs_file_size or 0),
         )
-    content_file.seek(0)
-    data = content_file.read()
-    await upload_data_to_instant_storage(data=data, ipfs_cid=response.json()["Hash"])
-
-    content: Content = db.query(Content).filter(Content.id == content_id).first()
-    content.ipfs_cid = response.json()["Hash"]
-    content.ipfs_file_size = int(response.json()["Size"])
-    content.availability = ContentAvailability.INSTANT
-    content.is_instant = True
-    db.commit()
-    db.refresh(content)
+        content.ipfs_cid = ipfs_cid
+        content.ipfs_file_size = ipfs_file_size
+        content.availability = ContentAvailability.INSTANT
+        content.is_instant = True
+        await db.commit()
+        await db.refresh(content)
     log.debug(f"fetched {content=}")
@@ -1,12 +1,14 @@
-from casdoor import CasdoorSDK
-from fastapi import APIRouter, Request, status
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Request, status
+from sqlalchemy import select
 
 import storage.web.routers.internal.internal as internal_router
-from storage.config import settings
 from storage.db.models import User
 from storage.db.models.tenant import Tenant, Token
 from storage.db.multitenancy import tenant_create
-from storage.db.session import with_db
+from storage.db.session import with_async_db
+from storage.services.casdoor import casdoor
 from storage.web.routers import (
     contents,
     jobs,
@@ -14,6 +16,7 @@ from storage.web.routers import (
     permissions,
     specifications,
     tokens,
+    uploads,
     users,
 )
 from storage.web.security import create_api_key, get_api_key_hash
@@ -35,6 +38,7 @@ api_router.include_router(
     specifications.router, prefix="/specifications", tags=["Specifications"]
 )
 api_router.include_router(tokens.router, prefix="/tokens", tags=["Tokens"])
+api_router.include_router(uploads.router, prefix="/uploads", tags=["Uploads"])
 api_router.include_router(users.router, prefix="/users", tags=["Users"])
 
 
@@ -43,20 +47,16 @@ api_router.include_router(internal_router.router, prefix="/internal")
 
 @api_router.post("/signin")
 async def process_tenant_signin(request: Request):
-    sdk = CasdoorSDK(
-        endpoint=settings.CASDOOR_ENDPOINT,
-        client_id=settings.CASDOOR_CLIENT_ID,
-        client_secret=settings.CASDOOR_CLIENT_SECRET,
-        certificate=settings.CASDOOR_CERTIFICATE,
-        org_name=settings.CASDOOR_ORG_NAME,
-        application_name=settings.CASDOOR_APPLICATION_NAME,
-    )
     code = request.query_params.get("code")
-    access_token = sdk.get_oauth_token(code)
-    user = sdk.parse_jwt_token(access_token)
+    access_token = await casdoor.get_oauth_token(code)
+    if not access_token:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Sign in failed"
+        )
+    user = casdoor.parse_jwt_token(access_token)
 
-    with with_db() as db:
-        tenant = db.query(Tenant).filter(Tenant.name == user["name"]).first()
+    async with with_async_db() as db:
+        tenant = await db.scalar(select(Tenant).filter(Tenant.name == user["name"]))
     if not tenant:
         tenant_name = user["name"]
         tenant = Tenant(
@@ -64,21 +64,21 @@ async def process_tenant_signin(request: Request):
             schema=tenant_name,
             host=tenant_name.replace("_", "-"),
         )
-        tenant = tenant_create(tenant)
+        tenant = await asyncio.to_thread(tenant_create, tenant)
     api_key = create_api_key()
     token = Token(
         hashed_token=get_api_key_hash(api_key),
         owner_id=tenant.id,
     )
-    with with_db() as db:
+    async with with_async_db() as db:
         db.add(token)
-        db.commit()
-    with with_db(tenant.schema) as db:
-        tenant_user = db.query(User).first()
+        await db.commit()
+    async with with_async_db(tenant.schema) as db:
+        tenant_user = await db.scalar(select(User).limit(1))
         if not tenant_user:
             tenant_user = User()
             db.add(tenant_user)
-            db.commit()
+            await db.commit()
 
     return {
         "status": "ok",
@@ -136,6 +136,14 @@ tags_metadata = [
             "token."
         ),
     },
+    {
+        "name": "Uploads",
+        "description": (
+            "Upload resource represents resumable upload of a large file. The file "
+            "is sent in chunks at increasing offsets, an interrupted upload continues "
+            "from its current offset. Completed upload turns into a content."
+        ),
+    },
     {
         "name": "Users",
         "description": (
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from storage.config import settings
+from storage.db.models.revoked_token import RevokedToken
+from storage.db.session import with_async_db
+from storage.logging import log
+
+SHARED = "shared"  # scope of tenant tokens, user tokens are scoped by tenant schema
+
+# session info key of revocations to apply once committed
+_PENDING_REVOCATIONS = "pending_revocations"
+
+
+class VerifiedCredentialCache:
+    """LRU cache of successfully verified credentials, so a credential presented
+    again skips the token lookup and the hash verification.
+
+    Entries are keyed by a digest of the presented credential, the credential
+    itself is never kept. An entry lives until the token expiry, but at most
+    `CREDENTIAL_CACHE_TTL` seconds: invalidation only reaches the cache of this
+    process, the other processes see token changes after the TTL.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        # key -> (token scope, token id, owner id, deadline)
+        self._entries: OrderedDict[tuple, tuple[str, int, int, float]] = OrderedDict()
+        self._keys_by_token: dict[tuple[str, int], set[tuple]] = {}
+
+    @staticmethod
+    def _key(scope: str, credential: str) -> tuple[str, bytes]:
+        return scope, hashlib.sha256(credential.encode()).digest()
+
+    def get(self, scope: str, credential: str) -> int | None:
+        """Get owner id of the token the credential was verified against."""
+
+        key = self._key(scope, credential)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        _, _, owner_id, deadline = entry
+        if deadline <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return owner_id
+
+    def put(
+        self,
+        scope: str,
+        credential: str,
+        token_id: int,
+        owner_id: int,
+        expiry: datetime | None,
+    ) -> None:
+        deadline = time.time() + settings.CREDENTIAL_CACHE_TTL
+        if expiry is not None:
+            deadline = min(deadline, expiry.replace(tzinfo=timezone.utc).timestamp())
+        key = self._key(scope, credential)
+        self._remove(key)
+        self._entries[key] = (scope, token_id, owner_id, deadline)
+        self._keys_by_token.setdefault((scope, token_id), set()).add(key)
+        if len(self._entries) > self._max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, scope: str, token_id: int) -> None:
+        """Drop the entries of a token, e.g. when it's updated or deleted."""
+
+        for key in self._keys_by_token.pop((scope, token_id), set()):
+            self._entries.pop(key, None)
+
+    def _remove(self, key: tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        scope, token_id, _, _ = entry
+        keys = self._keys_by_token.get((scope, token_id))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_token[(scope, token_id)]
+
+
+verified_credentials = VerifiedCredentialCache(settings.CREDENTIAL_CACHE_SIZE)
+
+
+def _timestamp(moment: datetime | None) -> float | None:
+    # timestamps are stored as naive UTC
+    if moment is None:
+        return None
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RevokedTokens:
+    """In-process copy of the access token deny-list.
+
+    The web application reloads it every `ACCESS_TOKEN_DENY_LIST_REFRESH_INTERVAL`
+    seconds, only the entries of tokens that aren't expired yet. Revocations made
+    by this process apply at once, the other processes see them after a reload.
+    """
+
+    def __init__(self):
+        # (tenant schema, token id) -> (revoked after, token expiry)
+        self._entries: dict[tuple[str, int], tuple[float, float | None]] = {}
+        # revocations of this process a reload started earlier could miss
+        self._recent: dict[tuple[str, int], tuple[float, float | None]] = {}
+        self._task: asyncio.Task | None = None
+
+    def is_revoked(self, tenant_schema: str, token_id: int) -> bool:
+        entry = self._entries.get((tenant_schema, token_id))
+        return entry is not None and entry[0] <= time.time()
+
+    def revoke(
+        self,
+        db,
+        tenant_schema: str,
+        token_id: int,
+        revoked_after: datetime,
+        token_expiry: datetime | None,
+    ) -> None:
+        """Add the token to the deny-list in the caller's transaction. This process
+        applies it once the transaction commits.
+        """
+
+        db.add(
+            RevokedToken(
+                tenant_schema=tenant_schema,
+                token_id=token_id,
+                revoked_after=revoked_after,
+                token_expiry=token_expiry,
+            )
+        )
+        session = getattr(db, "sync_session", db)
+        session.info.setdefault(_PENDING_REVOCATIONS, []).append(
+            (
+                (tenant_schema, token_id),
+                (_timestamp(revoked_after), _timestamp(token_expiry)),
+            )
+        )
+
+    def _apply(self, key: tuple[str, int], entry: tuple) -> None:
+        self._recent[key] = entry
+        self._add(self._entries, key, entry)
+
+    @staticmethod
+    def _add(entries: dict, key: tuple[str, int], entry: tuple) -> None:
+        current = entries.get(key)
+        if current is None or entry[0] < current[0]:
+            entries[key] = entry
+
+    async def refresh(self) -> None:
+        recent = self._recent
+        self._recent = {}
+        async with with_async_db() as db:
+            rows = (
+                await db.execute(
+                    select(
+                        RevokedToken.tenant_schema,
+                        RevokedToken.token_id,
+                        RevokedToken.revoked_after,
+                        RevokedToken.token_expiry,
+                    ).filter(
+                        (RevokedToken.token_expiry == None)  # noqa: E711
+                        | (RevokedToken.token_expiry > func.now())
+                    )
+                )
+            ).all()
+        entries: dict[tuple[str, int], tuple[float, float | None]] = {}
+        for row in rows:
+            self._add(
+                entries,
+                (row.tenant_schema, row.token_id),
+                (_timestamp(row.revoked_after), _timestamp(row.token_expiry)),
+            )
+        for key, entry in (recent | self._recent).items():
+            self._add(entries, key, entry)
+        self._entries = entries
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(settings.ACCESS_TOKEN_DENY_LIST_REFRESH_INTERVAL)
+            try:
+                await self.refresh()
+            except Exception as e:
+                log.warning(f"access token deny-list refresh failed: {e!r}")
+
+    async def start(self) -> None:
+        await self.refresh()
+        self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+revoked_tokens = RevokedTokens()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_revocations(session):
+    for key, entry in session.info.pop(_PENDING_REVOCATIONS, ()):
+        revoked_tokens._apply(key, entry)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_revocations(session):
+    session.info.pop(_PENDING_REVOCATIONS, None)
@@ -1,16 +1,26 @@
-from typing import Generator
+import time
+from typing import AsyncGenerator, Generator
 from urllib.parse import urlparse
 
 from fastapi import Depends, HTTPException, Request, Security, status
 from fastapi.security.api_key import APIKeyHeader
-from sqlalchemy import func
+from sqlalchemy import func, select
 
 from storage.config import settings
 from storage.db.models import Token, User
 from storage.db.models.tenant import Tenant, TokenForTenant
-from storage.db.session import with_db
+from storage.db.multitenancy import tenant_registry
+from storage.db.session import with_async_db, with_db
 from storage.schemas.permission import PermissionWrapper
-from storage.web.security import decode_access_token, verify_api_key
+from storage.web.credentials import SHARED, revoked_tokens, verified_credentials
+from storage.web.security import (
+    decode_access_token,
+    decode_signed_access_token,
+    get_api_key_hash,
+    is_legacy_api_key_hash,
+    is_signed_access_token,
+    verify_api_key_async,
+)
 
 db = {
     "contents": {},
@@ -43,8 +53,7 @@ def get_tenant(request: Request) -> Tenant:
     host_without_port = request.headers["host"].split(":", 1)[0]
     url = urlparse(host_without_port)
     subdomain = url.path.split(".", 1)[0]
-    with with_db(None) as db:
-        tenant = db.query(Tenant).filter(Tenant.host == subdomain).one_or_none()
+    tenant = tenant_registry.get(subdomain)
 
     if tenant is None:
         raise HTTPException(
@@ -59,6 +68,11 @@ def get_db(tenant: Tenant = Depends(get_tenant)) -> Generator:
         yield db
 
 
+async def get_async_db(tenant: Tenant = Depends(get_tenant)) -> AsyncGenerator:
+    async with with_async_db(tenant.schema) as db:
+        yield db
+
+
 def get_tokens_by_tenant_id(db, tenant_id: int) -> list[TokenForTenant]:
     tokens = (
         db.query(TokenForTenant)
@@ -83,47 +97,131 @@ def get_access_token(access_token_header: str = Security(api_key_header_auth)) -
     return access_token_header
 
 
-def get_current_tenant(
+async def check_api_key(db, token, api_key: str) -> bool:
+    """Verify the API key against the token. A legacy bcrypt hash of the token is
+    replaced with the digest once the key matches it.
+    """
+
+    if not await verify_api_key_async(api_key, token.hashed_token):
+        return False
+    if is_legacy_api_key_hash(token.hashed_token):
+        token.hashed_token = get_api_key_hash(api_key)
+        await db.commit()
+    return True
+
+
+async def find_token_by_api_key(db, model, api_key: str, *criteria):
+    """Find the token of the API key by its digest. Tokens with legacy bcrypt hashes
+    are verified one by one, and the hash of the matching one is replaced with
+    the digest, so the key is looked up by the digest from then on.
+    """
+
+    token = await db.scalar(
+        select(model)
+        .filter(*criteria, model.hashed_token == get_api_key_hash(api_key))
+        .limit(1)
+    )
+    if token:
+        return token
+    legacy_tokens = (
+        await db.scalars(
+            select(model).filter(*criteria, model.hashed_token.like("$2%"))
+        )
+    ).all()
+    for token in legacy_tokens:
+        if await check_api_key(db, token, api_key):
+            return token
+    return None
+
+
+async def get_current_tenant(
     api_key: str = Depends(get_api_key),
     tenant: Tenant = Depends(get_tenant),
 ) -> Tenant:
-    with with_db() as db:
-        tokens = get_tokens_by_tenant_id(db, tenant.id)
-    if not tokens:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials2",
+    if verified_credentials.get(SHARED, api_key) == tenant.id:
+        return tenant
+    async with with_async_db() as db:
+        token = await find_token_by_api_key(
+            db,
+            TokenForTenant,
+            api_key,
+            TokenForTenant.owner_id == tenant.id,
+            (TokenForTenant.expiry == None)  # noqa: E711
+            | (TokenForTenant.expiry > func.now()),
+        )
+        if not token:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+        verified_credentials.put(SHARED, api_key, token.id, tenant.id, token.expiry)
+
+    return tenant
+
+
+def get_user_by_signed_access_token(access_token: str, tenant: Tenant) -> User:
+    """Authenticate by the signature and the deny-list, without a database round
+    trip. The user is transient and carries the id only.
+    """
+
+    claims = decode_signed_access_token(access_token)
+    if (
+        claims is None
+        or claims.tenant_schema != tenant.schema
+        or (claims.expiry is not None and claims.expiry <= time.time())
+        or (
+            settings.ACCESS_TOKEN_REVOCATION_CHECK
+            and revoked_tokens.is_revoked(tenant.schema, claims.token_id)
         )
-    verify = [verify_api_key(api_key, token.hashed_token) for token in tokens]
-    if not any(verify):
+    ):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-
-    return tenant
+    return User(id=claims.user_id)
 
 
-def get_current_user(
+async def get_current_user(
     access_token: str = Depends(get_access_token),
     tenant: Tenant = Depends(get_tenant),
 ) -> User:
+    if is_signed_access_token(access_token):
+        return get_user_by_signed_access_token(access_token, tenant)
+
+    user_id = verified_credentials.get(tenant.schema, access_token)
+    if user_id is not None:
+        async with with_async_db(tenant.schema) as db:
+            user = await db.get(User, user_id)
+        if user is None:
+            # deleted through another process, this one keeps its tokens cached
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+            )
+        return user
+
     token_id, plain_api_key = decode_access_token(access_token)
-    with with_db(tenant.schema) as db:
-        token: Token | None = db.query(Token).filter(Token.id == token_id).first()
-    if not token:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
-        )
-    valid = verify_api_key(plain_api_key, token.hashed_token)
-    if not valid:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
+    async with with_async_db(tenant.schema) as db:
+        # the token, its owner and the expiry check in a single statement
+        row = (
+            await db.execute(
+                select(Token, User)
+                .join(User, User.id == Token.owner_id)
+                .filter(
+                    Token.id == token_id,
+                    (Token.expiry == None) | (Token.expiry > func.now()),  # noqa: E711
+                )
+            )
+        ).first()
+        if not row or not await check_api_key(db, row.Token, plain_api_key):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
+            )
+        token, user = row
+        verified_credentials.put(
+            tenant.schema, access_token, token.id, user.id, token.expiry
         )
-    with with_db(tenant.schema) as db:
-        user: User = db.query(User).filter(User.id == token.owner_id).first()
     return user
 
 
@@ -0,0 +1,59 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass
+from datetime import datetime
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+
+@dataclass
+class CursorParams:
+    cursor: str | None = Query(None, description="Token of the page to get")
+    size: int = Query(50, ge=1, le=100, description="Page size")
+    include_total: bool = Query(
+        False, description="Count all the items, slow for large listings"
+    )
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    return urlsafe_b64encode(json.dumps([created_at.isoformat(), id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, id = json.loads(urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(id)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+
+async def paginate_by_cursor(
+    db: AsyncSession, statement: Select, model, params: CursorParams
+) -> dict:
+    """Get a page of the statement rows in `(created_at, id)` order. The next page
+    starts right after the last row, so it's found by the index instead of
+    skipping all the rows before it.
+    """
+
+    page_statement = statement.order_by(model.created_at, model.id).limit(
+        params.size + 1
+    )
+    if params.cursor:
+        page_statement = page_statement.filter(
+            tuple_(model.created_at, model.id) > tuple_(*decode_cursor(params.cursor))
+        )
+    items = (await db.scalars(page_statement)).all()
+
+    next_cursor = None
+    if len(items) > params.size:
+        items = items[: params.size]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    total = None
+    if params.include_total:
+        total = await db.scalar(select(func.count()).select_from(statement.subquery()))
+    return {"items": items, "next_cursor": next_cursor, "total": total}
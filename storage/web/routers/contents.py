@@ -1,10 +1,10 @@
-import httpx
-from fastapi import APIRouter, BackgroundTasks, Depends, Request, UploadFile, status
+from collections import defaultdict
+
+from fastapi import APIRouter, Depends, File, Request, UploadFile, status
 from fastapi.exceptions import HTTPException
 from fastapi.responses import RedirectResponse
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
-from sqlalchemy import select
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from storage.config import settings
 from storage.db.models import Content, Permission, User
@@ -12,24 +12,28 @@ from storage.db.models.content import ContentAvailability
 from storage.db.models.filecoin import RestoreRequest, RestoreRequestStatus
 from storage.db.models.permission import PermissionKind
 from storage.db.models.tenant import Tenant
-from storage.db.session import SessionLocal, with_db
+from storage.db.session import with_async_db
 from storage.logging import log
 from storage.schemas import content as schemas
+from storage.schemas.pagination import CursorPage
+from storage.services.ingest_worker import enqueue_ingest
 from storage.services.instant_storage import (
     generate_access_link_for_instant_storage_data,
-    upload_data_to_instant_storage,
 )
-from storage.upload import process_data_from_origin
+from storage.services.usage import record_usage
+from storage.upload import ingest_file, ingest_files
 from storage.web import deps
+from storage.web.pagination import CursorParams, paginate_by_cursor
 
 router = APIRouter()
 
 
-@router.get("/", response_model=Page[schemas.Content])
+@router.get("/", response_model=CursorPage[schemas.Content])
 async def read_contents(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
+    page: CursorParams = Depends(),
 ):
     """Read contents the user owns or has permission to read."""
 
@@ -53,7 +57,9 @@ async def read_contents(
     # )
     # return [*contents_owner, *contents_permissed]
 
-    return paginate(db, select(Content).filter(Content.owner_id == current_user.id))
+    return await paginate_by_cursor(
+        db, select(Content).filter(Content.owner_id == current_user.id), Content, page
+    )
 
 
 @router.post(
@@ -74,9 +80,9 @@ async def read_contents(
 )
 async def create_content(
     *,
-    db: SessionLocal = Depends(deps.get_db),
-    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
+    tenant: Tenant = Depends(deps.get_tenant),
     file_in: UploadFile | None = None,
     request: Request,
 ):
@@ -85,29 +91,19 @@ async def create_content(
     """
     if file_in:
         log.debug(f"create_content, {file_in.filename=}")
-        async with httpx.AsyncClient(
-            base_url=settings.IPFS_HTTP_PROVIDER,
-        ) as client:
-            response = await client.post(
-                "/api/v0/add",
-                params={"cid-version": 1, "only-hash": True},
-                files={"upload-files": file_in.file},
-            )
-        file_in.file.seek(0)
-        data = file_in.file.read()
-        ipfs_cid = response.json()["Hash"]
-        await upload_data_to_instant_storage(data=data, ipfs_cid=ipfs_cid)
+        ipfs_cid, ipfs_file_size = await ingest_file(file_in)
         content = Content(
             filename=file_in.filename,
             ipfs_cid=ipfs_cid,
-            ipfs_file_size=int(response.json()["Size"]),
+            ipfs_file_size=ipfs_file_size,
             availability=ContentAvailability.INSTANT,
             is_instant=True,
             owner_id=current_user.id,
         )
         db.add(content)
-        db.commit()
-        db.refresh(content)
+        await record_usage(db, tenant.schema, current_user.id, 1, ipfs_file_size)
+        await db.commit()
+        await db.refresh(content)
         return content
 
     body = await request.json()
@@ -115,13 +111,11 @@ async def create_content(
 
     if content_in:
         log.debug(f"create_content, {content_in.origin=}, {current_user.id=}")
-        content_id: int | None = (
-            db.query(Content.id)
-            .filter(
+        content_id: int | None = await db.scalar(
+            select(Content.id).filter(
                 Content.owner_id == current_user.id,
                 Content.origin == content_in.origin,
             )
-            .scalar()
         )
         if content_id:
             return RedirectResponse(
@@ -135,19 +129,90 @@ async def create_content(
             owner_id=current_user.id,
         )
         db.add(content)
-        db.commit()
-        db.refresh(content)
-
-        background_tasks.add_task(
-            process_data_from_origin,
-            origin=content.origin,
+        await db.flush()
+        enqueue_ingest(
+            db,
+            tenant_schema=tenant.schema,
             content_id=content.id,
-            db=db,
+            origin=content_in.origin,
         )
+        await record_usage(db, tenant.schema, current_user.id, 1)
+        await db.commit()
+        await db.refresh(content)
 
         return content
 
 
+@router.post(
+    "/batch",
+    response_model=list[schemas.ContentBatchItem],
+    status_code=status.HTTP_201_CREATED,
+    response_description="Created",
+    responses={status.HTTP_400_BAD_REQUEST: {"description": "Too many files"}},
+)
+async def create_contents_batch(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_user),
+    tenant: Tenant = Depends(deps.get_tenant),
+    files: list[UploadFile] = File(...),
+):
+    """Create contents of many files at once. Results follow the order of the files,
+    every one of them holds either created content or an error.
+    """
+
+    log.debug(f"create_contents_batch, {len(files)=}, {current_user.id=}")
+    if len(files) > settings.UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.UPLOAD_BATCH_MAX_FILES} files allowed",
+        )
+    results = await ingest_files(files)
+    values = [
+        dict(
+            filename=file.filename,
+            ipfs_cid=result[0],
+            ipfs_file_size=result[1],
+            availability=ContentAvailability.INSTANT,
+            is_instant=True,
+            owner_id=current_user.id,
+        )
+        for file, result in zip(files, results)
+        if not isinstance(result, Exception)
+    ]
+    contents = []
+    if values:
+        # a single multi-row INSERT, its rows come back in no particular order
+        contents = (
+            await db.execute(
+                insert(Content).values(values).returning(*Content.__table__.columns)
+            )
+        ).all()
+        await record_usage(
+            db,
+            tenant.schema,
+            current_user.id,
+            len(values),
+            sum(value["ipfs_file_size"] for value in values),
+        )
+        await db.commit()
+
+    # rows are matched to the files by the filename and the CID, files equal
+    # in both get contents that differ by the id only
+    created = defaultdict(list)
+    for content in contents:
+        created[content.filename, content.ipfs_cid].append(content)
+    return [
+        schemas.ContentBatchItem(filename=file.filename, error="Failed to store")
+        if isinstance(result, Exception)
+        else schemas.ContentBatchItem(
+            filename=file.filename,
+            content=schemas.Content.from_orm(created[file.filename, result[0]].pop()),
+        )
+        for file, result in zip(files, results)
+    ]
+
+
 @router.get(
     "/{content_id}",
     response_model=schemas.Content,
@@ -155,26 +220,24 @@ async def create_content(
 )
 async def read_content_by_id(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
     content_id: int,
 ):
     """Read content the user owns or has permission to read."""
 
     log.debug(f"read_content_by_id, {content_id=}, {current_user.id=}")
-    content: Content | None = db.query(Content).filter(Content.id == content_id).first()
+    content: Content | None = await db.get(Content, content_id)
     if not content:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Content not found"
         )
-    permission: Permission = (
-        db.query(Permission)
-        .filter(
+    permission: Permission | None = await db.scalar(
+        select(Permission).filter(
             Permission.assignee_id == current_user.id,
             Permission.content_id == content.id,
             Permission.kind == PermissionKind.READ,
         )
-        .first()
     )
     if current_user.id != content.owner_id and not permission:
         raise HTTPException(
@@ -192,14 +255,15 @@ async def read_content_by_id(
 )
 async def delete_content(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
+    tenant: Tenant = Depends(deps.get_tenant),
     content_id: int,
 ):
     """Delete content the user owns."""
 
     log.debug(f"delete_content, {content_id=}, {current_user.id=}")
-    content: Content = db.query(Content).filter(Content.id == content_id).first()
+    content: Content | None = await db.get(Content, content_id)
     if not content:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Content not found"
@@ -208,41 +272,42 @@ async def delete_content(
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
         )
-    db.delete(content)
-    db.commit()
+    await db.delete(content)
+    await record_usage(
+        db, tenant.schema, content.owner_id, -1, -(content.ipfs_file_size or 0)
+    )
+    await db.commit()
     return content
 
 
 @router.post("/{content_id}/restore")
 async def restore_content_file(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
     tenant: Tenant = Depends(deps.get_tenant),
     content_restore_request: schemas.ContentRestoreRequest,
     content_id: int,
 ):
     log.debug(f"restore_content_by_id, {content_id=}, {current_user.id=}")
-    content: Content | None = db.query(Content).filter(Content.id == content_id).first()
+    content: Content | None = await db.get(Content, content_id)
     if not content:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Content not found"
         )
-    permission: Permission = (
-        db.query(Permission)
-        .filter(
+    permission: Permission | None = await db.scalar(
+        select(Permission).filter(
             Permission.assignee_id == current_user.id,
             Permission.content_id == content.id,
             Permission.kind == PermissionKind.READ,
         )
-        .first()
     )
     if current_user.id != content.owner_id and not permission:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
         )
     if content.availability == ContentAvailability.ARCHIVE:
-        with with_db() as session:
+        async with with_async_db() as session:
             restore_request = RestoreRequest(
                 tenant_name=tenant.name,
                 content_id=content.id,
@@ -253,7 +318,7 @@ async def restore_content_file(
             if content_restore_request.webhook_url:
                 restore_request.webhook_url = content_restore_request.webhook_url
             session.add(restore_request)
-            session.commit()
+            await session.commit()
 
         return {"status": "ok"}
     else:
@@ -270,26 +335,24 @@ async def restore_content_file(
 )
 async def download_content_file(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
     content_id: int,
 ):
     """Returns temporary link to file the user owns or has permission to read."""
 
     log.debug(f"download_content_file, {content_id=}, {current_user.id=}")
-    content: Content = db.query(Content).filter(Content.id == content_id).first()
+    content: Content | None = await db.get(Content, content_id)
     if not content:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Content not found"
         )
-    permission: Permission = (
-        db.query(Permission)
-        .filter(
+    permission: Permission | None = await db.scalar(
+        select(Permission).filter(
             Permission.assignee_id == current_user.id,
             Permission.content_id == content.id,
             Permission.kind == PermissionKind.READ,
         )
-        .first()
     )
     if current_user.id != content.owner_id and not permission:
         raise HTTPException(
@@ -1,11 +1,12 @@
 import httpx
 from fastapi import APIRouter, Depends
 from fastapi_camelcase import CamelModel as BaseModel
+from sqlalchemy import select, update
 from sqlalchemy.sql import case
 
 from storage.db.models.content import Content, ContentAvailability
 from storage.db.models.filecoin import Car, RestoreRequest, RestoreRequestStatus
-from storage.db.session import with_db
+from storage.db.session import with_async_db
 from storage.web import deps
 
 router = APIRouter()
@@ -37,8 +38,10 @@ class CarsWithActiveDeals(BaseModel):
 
 @router.get(".getCarToProcess")
 async def get_car_to_process(authed=Depends(deps.get_app_by_admin_token)):
-    with with_db() as db:
-        car = db.query(Car).filter(Car.comm_p.is_(None)).order_by(Car.id.desc()).first()
+    async with with_async_db() as db:
+        car = await db.scalar(
+            select(Car).filter(Car.comm_p.is_(None)).order_by(Car.id.desc()).limit(1)
+        )
     if car:
         return {
             "pack_uuid": car.pack_uuid,
@@ -52,26 +55,25 @@ async def start_restore_process(
     start_restore_process_request: StartRestoreProcessSchema,
     authed=Depends(deps.get_app_by_admin_token),
 ):
-    with with_db() as db:
+    async with with_async_db() as db:
         try:
             restore_request = (
-                db.query(RestoreRequest)
-                .filter(RestoreRequest.status == RestoreRequestStatus.PENDING)
-                .with_for_update()
-                .one()
-            )
+                await db.scalars(
+                    select(RestoreRequest)
+                    .filter(RestoreRequest.status == RestoreRequestStatus.PENDING)
+                    .with_for_update()
+                )
+            ).one()
         except Exception as e:
             print(e.__traceback__)
             return {}
         restore_request.worker_instance = start_restore_process_request.worker_instance
         restore_request.status = RestoreRequestStatus.PROCESSING
-        db.commit()
-        db.refresh(restore_request)
+        await db.commit()
+        await db.refresh(restore_request)
 
-    with with_db(tenant_schema=restore_request.tenant_name) as db:
-        content = (
-            db.query(Content).filter(Content.id == restore_request.content_id).first()
-        )
+    async with with_async_db(tenant_schema=restore_request.tenant_name) as db:
+        content = await db.get(Content, restore_request.content_id)
     return {"original_cid": content.ipfs_cid, "restore_request_id": restore_request.id}
 
 
@@ -80,30 +82,28 @@ async def finish_restore_process(
     finish_restore_process_request: FinishRestoreProcessSchema,
     authed=Depends(deps.get_app_by_admin_token),
 ):
-    with with_db() as db:
+    async with with_async_db() as db:
         restore_request = (
-            db.query(RestoreRequest)
-            .filter(
-                RestoreRequest.id == finish_restore_process_request.restore_request_id
-                and RestoreRequest.worker_instance
-                == finish_restore_process_request.worker_instance
+            await db.scalars(
+                select(RestoreRequest)
+                .filter(
+                    RestoreRequest.id
+                    == finish_restore_process_request.restore_request_id
+                    and RestoreRequest.worker_instance
+                    == finish_restore_process_request.worker_instance
+                )
+                .with_for_update()
             )
-            .with_for_update()
-            .one()
-        )
+        ).one()
         restore_request.status = finish_restore_process_request.status
-        db.commit()
-        db.refresh(restore_request)
+        await db.commit()
+        await db.refresh(restore_request)
 
     if finish_restore_process_request.status == RestoreRequestStatus.DONE:
-        with with_db(tenant_schema=restore_request.tenant_name) as db:
-            content = (
-                db.query(Content)
-                .filter(Content.id == restore_request.content_id)
-                .first()
-            )
+        async with with_async_db(tenant_schema=restore_request.tenant_name) as db:
+            content = await db.get(Content, restore_request.content_id)
             content.availability = ContentAvailability.INSTANT
-            db.commit()
+            await db.commit()
     if restore_request.webhook_url:
         try:
             async with httpx.AsyncClient() as client:
@@ -126,7 +126,7 @@ async def finish_restore_process(
 
 @router.get(".getPreparedCars")
 async def get_prepared_cars(authed=Depends(deps.get_app_by_admin_token)):
-    with with_db() as db:
+    async with with_async_db() as db:
         cars = [
             {
                 "pack_uuid": car.pack_uuid,
@@ -136,7 +136,7 @@ async def get_prepared_cars(authed=Depends(deps.get_app_by_admin_token)):
                 "car_size": car.car_size,
                 "piece_size": car.piece_size,
             }
-            for car in db.query(Car).filter(Car.comm_p.isnot(None)).all()
+            for car in await db.scalars(select(Car).filter(Car.comm_p.isnot(None)))
         ]
 
     return {"status": "ok", "cars": cars}
@@ -163,29 +163,31 @@ async def car_created_callback(
             encrypted_content["encrypted_size"]
         )
 
-    with with_db(tenant_schema=car.tenant_name) as tenant_db:
-        tenant_db.query(Content).filter(
-            Content.ipfs_cid.in_(content_encrypted_cid_updates)
-        ).update(
-            {
-                Content.encrypted_file_cid: case(
-                    content_encrypted_cid_updates, value=Content.ipfs_cid
-                ),
-                Content.encrypted_file_size: case(
-                    content_encrypted_size_updates, value=Content.ipfs_cid
-                ),
-            },
-            synchronize_session=False,
+    async with with_async_db(tenant_schema=car.tenant_name) as tenant_db:
+        await tenant_db.execute(
+            update(Content)
+            .filter(Content.ipfs_cid.in_(content_encrypted_cid_updates))
+            .values(
+                {
+                    Content.encrypted_file_cid: case(
+                        content_encrypted_cid_updates, value=Content.ipfs_cid
+                    ),
+                    Content.encrypted_file_size: case(
+                        content_encrypted_size_updates, value=Content.ipfs_cid
+                    ),
+                }
+            )
+            .execution_options(synchronize_session=False)
         )
-        tenant_db.commit()
+        await tenant_db.commit()
 
-    with with_db() as db:
-        car_in_db = db.query(Car).filter(Car.pack_uuid == pack_uuid).first()
+    async with with_async_db() as db:
+        car_in_db = await db.scalar(select(Car).filter(Car.pack_uuid == pack_uuid))
         car_in_db.root_cid = root_cid
         car_in_db.comm_p = comm_p
         car_in_db.piece_size = piece_size
         car_in_db.car_size = car_size
-        db.commit()
+        await db.commit()
 
     return {"status": "ok"}
 
@@ -194,29 +196,35 @@ async def car_created_callback(
 async def setArchivedContents(
     cars_active_deals: CarsWithActiveDeals, authed=Depends(deps.get_app_by_admin_token)
 ):
-    with with_db() as db:
+    async with with_async_db() as db:
         content_packs = (
-            db.query(Car)
-            .filter(Car.pack_uuid.in_(cars_active_deals.content_pack_ids))
-            .all()
-        )
+            await db.scalars(
+                select(Car).filter(
+                    Car.pack_uuid.in_(cars_active_deals.content_pack_ids)
+                )
+            )
+        ).all()
     for content_pack in content_packs:
         print(content_pack.tenant_name)
-        with with_db(tenant_schema=content_pack.tenant_name) as db:
+        async with with_async_db(tenant_schema=content_pack.tenant_name) as db:
             contents = (
-                db.query(Content)
-                .filter(Content.ipfs_cid.in_(content_pack.original_content_cids))
-                .all()
-            )
+                await db.scalars(
+                    select(Content).filter(
+                        Content.ipfs_cid.in_(content_pack.original_content_cids)
+                    )
+                )
+            ).all()
             for content in contents:
                 print(content.id)
-            db.query(Content).filter(
-                Content.ipfs_cid.in_(content_pack.original_content_cids)
-            ).update(
-                {
-                    Content.availability: ContentAvailability.ARCHIVE,
-                    Content.is_filecoin: True,
-                }
+            await db.execute(
+                update(Content)
+                .filter(Content.ipfs_cid.in_(content_pack.original_content_cids))
+                .values(
+                    {
+                        Content.availability: ContentAvailability.ARCHIVE,
+                        Content.is_filecoin: True,
+                    }
+                )
             )
-            db.commit()
+            await db.commit()
     return {"status": "ok"}
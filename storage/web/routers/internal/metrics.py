@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from storage import metrics
+from storage.web import deps
+
+router = APIRouter()
+
+
+@router.get("", response_class=PlainTextResponse)
+async def get_metrics(authed=Depends(deps.get_app_by_admin_token)):
+    return metrics.render()
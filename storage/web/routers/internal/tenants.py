@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi_camelcase import CamelModel as BaseModel
-from sqlalchemy.sql import func
+from sqlalchemy import func, select
 
-from storage.db.models import Content
 from storage.db.models.filecoin import RestoreRequest
 from storage.db.models.tenant import Tenant
+from storage.db.models.usage import TenantUsage
 from storage.db.multitenancy import tenant_create
-from storage.db.session import with_db
+from storage.db.session import with_async_db
 from storage.web import deps
 
 router = APIRouter()
@@ -27,8 +29,8 @@ async def add_tenant(
     new_tenant: NewTenantSchema, authed=Depends(deps.get_app_by_admin_token)
 ):
     tenant_name = new_tenant.tenant_name.lower()
-    with with_db() as db:
-        tenant = db.query(Tenant).filter(Tenant.name == tenant_name).first()
+    async with with_async_db() as db:
+        tenant = await db.scalar(select(Tenant).filter(Tenant.name == tenant_name))
     if tenant:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Tenant already exists"
@@ -40,27 +42,57 @@ async def add_tenant(
         host=tenant_name.replace("_", "-"),
         merklebot_user_id=new_tenant.merklebot_user_id,
     )
-    tenant = tenant_create(tenant)
+    tenant = await asyncio.to_thread(tenant_create, tenant)
     return {"status": "ok", "result": tenant}
 
 
 @router.get(".list")
 async def list_tenants(authed=Depends(deps.get_app_by_admin_token)):
-    with with_db() as db:
-        tenants = db.query(Tenant).all()
+    async with with_async_db() as db:
+        tenants = (await db.scalars(select(Tenant))).all()
     return {"status": "ok", "tenants": tenants}
 
 
 @router.get(".getStats")
 async def get_stats(tenant_name: str, authed=Depends(deps.get_app_by_admin_token)):
-    with with_db(tenant_schema=tenant_name) as db:
-        contents_number = db.query(Content).count()
-        contents_funcs = db.query(
-            func.sum(Content.ipfs_file_size).label("sum_ipfs_file_size")
-        ).first()
+    async with with_async_db() as db:
+        usage = await db.get(TenantUsage, tenant_name)
+    return {
+        "contents_number": usage.contents_number if usage else 0,
+        "contents_size": usage.contents_size if usage else 0,
+    }
+
+
+@router.get(".listStats")
+async def list_stats(
+    tenant_names: list[str] | None = Query(None),
+    authed=Depends(deps.get_app_by_admin_token),
+):
+    """Stats of all the tenants, or of the ones named, in a single query."""
+
+    statement = (
+        select(
+            Tenant.name,
+            func.coalesce(TenantUsage.contents_number, 0),
+            func.coalesce(TenantUsage.contents_size, 0),
+        )
+        .outerjoin(TenantUsage, TenantUsage.tenant_schema == Tenant.schema)
+        .order_by(Tenant.name)
+    )
+    if tenant_names:
+        statement = statement.filter(Tenant.name.in_(tenant_names))
+    async with with_async_db() as db:
+        rows = (await db.execute(statement)).all()
     return {
-        "contents_number": contents_number,
-        "contents_size": contents_funcs["sum_ipfs_file_size"],
+        "status": "ok",
+        "stats": [
+            {
+                "tenant_name": name,
+                "contents_number": contents_number,
+                "contents_size": contents_size,
+            }
+            for name, contents_number, contents_size in rows
+        ],
     }
 
 
@@ -68,15 +100,15 @@ async def get_stats(tenant_name: str, authed=Depends(deps.get_app_by_admin_token
 async def get_unreported_restore_requests(
     tenant_name: str, authed=Depends(deps.get_app_by_admin_token)
 ):
-    with with_db() as db:
+    async with with_async_db() as db:
         restore_requests = (
-            db.query(RestoreRequest)
-            .filter(
-                RestoreRequest.tenant_name == tenant_name
-                and RestoreRequest.is_reported != True  # noqa
+            await db.scalars(
+                select(RestoreRequest).filter(
+                    RestoreRequest.tenant_name == tenant_name
+                    and RestoreRequest.is_reported != True  # noqa
+                )
             )
-            .all()
-        )
+        ).all()
         return {"status": "ok", "restore_requests": restore_requests}
 
 
@@ -84,15 +116,13 @@ async def get_unreported_restore_requests(
 async def set_restore_requests_reported(
     req: RestoreRequestReported, authed=Depends(deps.get_app_by_admin_token)
 ):
-    with with_db() as db:
-        restore_request = (
-            db.query(RestoreRequest)
-            .filter(
+    async with with_async_db() as db:
+        restore_request = await db.scalar(
+            select(RestoreRequest).filter(
                 RestoreRequest.id == req.restore_request_id
                 and RestoreRequest.tenant_name == req.tenant_name
             )
-            .first()
         )
         restore_request.is_reported = True
-        db.commit()
+        await db.commit()
         return {"status": "ok"}
@@ -1,20 +1,23 @@
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi_camelcase import CamelModel as BaseModel
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
 from sqlalchemy import select
-from sqlalchemy.sql import func
 
 from storage.db.models import Content
 from storage.db.models.tenant import Tenant
 from storage.db.models.token import Token
+from storage.db.models.usage import UserUsage
 from storage.db.models.user import User
-from storage.db.session import with_db
+from storage.db.session import with_async_db
 from storage.schemas import content as content_schemas
+from storage.schemas.pagination import CursorPage
 from storage.services.instant_storage import (
     generate_access_link_for_instant_storage_data,
 )
 from storage.web import deps
+from storage.web.credentials import revoked_tokens, verified_credentials
+from storage.web.pagination import CursorParams, paginate_by_cursor
 from storage.web.security import create_access_token, create_api_key, get_api_key_hash
 
 router = APIRouter()
@@ -37,17 +40,17 @@ class RemoveTokenSchema(BaseModel):
 
 @router.post(".add")
 async def add_user(user: NewUserSchema, authed=Depends(deps.get_app_by_admin_token)):
-    with with_db() as db:
-        tenant = db.query(Tenant).filter(Tenant.name == user.tenant_name).first()
+    async with with_async_db() as db:
+        tenant = await db.scalar(select(Tenant).filter(Tenant.name == user.tenant_name))
     if not tenant:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Tenant doesn't exist"
         )
-    with with_db(tenant_schema=tenant.schema) as db:
+    async with with_async_db(tenant_schema=tenant.schema) as db:
         user = User()
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
 
     return {"status": "ok", "user": user}
 
@@ -56,13 +59,15 @@ async def add_user(user: NewUserSchema, authed=Depends(deps.get_app_by_admin_tok
 async def list_tokens(
     tenant_name: str, user_id: int, authed=Depends(deps.get_app_by_admin_token)
 ):
-    with with_db(tenant_schema=tenant_name) as db:
-        user = db.query(User).filter(User.id == user_id).first()
+    async with with_async_db(tenant_schema=tenant_name) as db:
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Tenant doesn't exist"
             )
-        tokens = db.query(Token).filter(Token.owner_id == user.id).all()
+        tokens = (
+            await db.scalars(select(Token).filter(Token.owner_id == user.id))
+        ).all()
     return {"status": "ok", "tokens": tokens}
 
 
@@ -70,21 +75,16 @@ async def list_tokens(
 async def get_stats(
     tenant_name: str, user_id: int, authed=Depends(deps.get_app_by_admin_token)
 ):
-    with with_db(tenant_schema=tenant_name) as db:
-        user = db.query(User).filter(User.id == user_id).first()
+    async with with_async_db(tenant_schema=tenant_name) as db:
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Tenant doesn't exist"
             )
-        contents_number = db.query(Content).filter(Content.owner_id == user.id).count()
-        contents_funcs = (
-            db.query(func.sum(Content.ipfs_file_size).label("sum_ipfs_file_size"))
-            .filter(Content.owner_id == user.id)
-            .first()
-        )
+        usage = await db.get(UserUsage, user.id)
     return {
-        "contents_number": contents_number,
-        "contents_size": contents_funcs["sum_ipfs_file_size"],
+        "contents_number": usage.contents_number if usage else 0,
+        "contents_size": usage.contents_size if usage else 0,
     }
 
 
@@ -95,16 +95,16 @@ async def get_content_download_link(
     content_id: int,
     authed=Depends(deps.get_app_by_admin_token),
 ):
-    with with_db(tenant_schema=tenant_name) as db:
-        user = db.query(User).filter(User.id == user_id).first()
+    async with with_async_db(tenant_schema=tenant_name) as db:
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Tenant doesn't exist"
             )
-        content: Content = (
-            db.query(Content)
-            .filter(Content.id == content_id, Content.owner_id == user.id)
-            .first()
+        content: Content = await db.scalar(
+            select(Content).filter(
+                Content.id == content_id, Content.owner_id == user.id
+            )
         )
 
     presigned_url, expires_in = await generate_access_link_for_instant_storage_data(
@@ -113,38 +113,46 @@ async def get_content_download_link(
     return {"status": "ok", "url": presigned_url, "expires_in": expires_in}
 
 
-@router.get(".listContents", response_model=Page[content_schemas.Content])
+@router.get(".listContents", response_model=CursorPage[content_schemas.Content])
 async def list_contents(
-    tenant_name: str, user_id: int, authed=Depends(deps.get_app_by_admin_token)
+    tenant_name: str,
+    user_id: int,
+    page: CursorParams = Depends(),
+    authed=Depends(deps.get_app_by_admin_token),
 ):
-    with with_db(tenant_schema=tenant_name) as db:
-        user = db.query(User).filter(User.id == user_id).first()
+    async with with_async_db(tenant_schema=tenant_name) as db:
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Tenant doesn't exist"
             )
-        return paginate(db, select(Content).filter(Content.owner_id == user.id))
+        return await paginate_by_cursor(
+            db, select(Content).filter(Content.owner_id == user.id), Content, page
+        )
 
 
 @router.post(".createToken")
 async def create_token(
     user_req: UserInfoSchema, authed=Depends(deps.get_app_by_admin_token)
 ):
-    with with_db(tenant_schema=user_req.tenant_name) as db:
-        user = db.query(User).filter(User.id == user_req.user_id).first()
+    async with with_async_db(tenant_schema=user_req.tenant_name) as db:
+        user = await db.get(User, user_req.user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Tenant doesn't exist"
             )
+        # the key isn't handed out, signed access tokens don't carry it
         api_key = create_api_key()
         token = Token(
             hashed_token=get_api_key_hash(api_key),
             owner_id=user.id,
         )
         db.add(token)
-        db.commit()
-        db.refresh(token)
-        access_token = create_access_token(token.id, api_key)
+        await db.commit()
+        await db.refresh(token)
+        access_token = create_access_token(
+            user_req.tenant_name, user.id, token.id, token.expiry
+        )
     return {"status": "ok", "access_token": access_token}
 
 
@@ -152,20 +160,28 @@ async def create_token(
 async def remove_token(
     remove_token_req: RemoveTokenSchema, authed=Depends(deps.get_app_by_admin_token)
 ):
-    with with_db(tenant_schema=remove_token_req.tenant_name) as db:
-        user = db.query(User).filter(User.id == remove_token_req.user_id).first()
+    async with with_async_db(tenant_schema=remove_token_req.tenant_name) as db:
+        user = await db.get(User, remove_token_req.user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Tenant doesn't exist"
             )
 
-        token = (
-            db.query(Token)
-            .filter(
+        token = await db.scalar(
+            select(Token).filter(
                 (Token.id == remove_token_req.token_id) and (Token.owner_id == user.id)
             )
-            .first()
         )
-        db.delete(token)
-        db.commit()
+        revoked_tokens.revoke(
+            db,
+            remove_token_req.tenant_name,
+            token.id,
+            revoked_after=datetime.utcnow(),
+            token_expiry=token.expiry,
+        )
+        await db.delete(token)
+        await db.commit()
+    verified_credentials.invalidate(
+        remove_token_req.tenant_name, remove_token_req.token_id
+    )
     return {"status": "ok"}
@@ -1,12 +1,13 @@
 from fastapi import APIRouter, BackgroundTasks, Depends, status
 from fastapi.exceptions import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from storage.archive import replicate, restore
 from storage.db.models import Content, Job, Key
 from storage.db.models.content import ContentAvailability
 from storage.db.models.job import JobKind, JobStatus
 from storage.db.models.tenant import Tenant
-from storage.db.session import SessionLocal
 from storage.encryption import decrypt, encrypt
 from storage.logging import log
 from storage.schemas import job as schemas
@@ -18,13 +19,13 @@ router = APIRouter()
 @router.get("/", response_model=list[schemas.Job])
 async def read_jobs(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_tenant: Tenant = Depends(deps.get_current_tenant),
 ):
     """Read jobs created by the tenant."""
 
     log.debug(f"read_jobs, {current_tenant.id=}")
-    jobs: list[Job] = db.query(Job).all()
+    jobs: list[Job] = (await db.scalars(select(Job))).all()
     return jobs
 
 
@@ -41,25 +42,21 @@ async def read_jobs(
 async def create_job(
     *,
     background_tasks: BackgroundTasks,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_tenant: Tenant = Depends(deps.get_current_tenant),
     job_in: schemas.JobCreate,
 ):
     """Order a new job."""
 
     log.debug(f"create_job, {job_in=}, {current_tenant.id=}")
-    content: Content | None = (
-        db.query(Content).filter(Content.id == job_in.content_id).first()
-    )
+    content: Content | None = await db.get(Content, job_in.content_id)
     if not content:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Content not found"
         )
     match job_in.kind:
         case JobKind.ENCRYPT | JobKind.DECRYPT:
-            key: Key | None = (
-                db.query(Key).filter(Key.id == job_in.config["keyId"]).first()
-            )
+            key: Key | None = await db.get(Key, job_in.config["keyId"])
             if not key:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND, detail="Key not found"
@@ -77,8 +74,8 @@ async def create_job(
                 )
     job = Job(**job_in.dict(), status=JobStatus.CREATED)
     db.add(job)
-    db.commit()
-    db.refresh(job)
+    await db.commit()
+    await db.refresh(job)
     match job_in.kind:
         case JobKind.ENCRYPT:
             print(f"{current_tenant.host=}")
@@ -105,14 +102,14 @@ async def create_job(
 )
 async def read_job_by_id(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_tenant: Tenant = Depends(deps.get_current_tenant),
     job_id: int,
 ):
     """Read a certain job."""
 
     log.debug(f"read_job_by_id, {job_id=}, {current_tenant.id=}")
-    job: Job | None = db.query(Job).filter(Job.id == job_id).first()
+    job: Job | None = await db.get(Job, job_id)
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
@@ -123,15 +120,15 @@ async def read_job_by_id(
 @router.post("/{job_id}/webhooks/result", response_model=schemas.Job)
 async def webhook(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     job_id: int,
     job_result: schemas.JobResult,
 ):
     """For internal purposes only, don't use it."""
 
     log.debug(f"webhook, {job_id=}, {job_result=}")
-    job = db.query(Job).filter(Job.id == job_id).first()
-    content = db.query(Content).filter(Content.id == job.content_id).first()
+    job = await db.get(Job, job_id)
+    content = await db.get(Content, job.content_id)
 
     job.status = (
         JobStatus.COMPLETE if job_result.status == "finished" else JobStatus.FAILED
@@ -142,14 +139,14 @@ async def webhook(
             if job_result.status == "finished":
                 content.encrypted_file_cid = job_result.result["encrypted_cid"]
                 content.encrypted_file_size = int(job_result.result["encrypted_size"])
-                db.commit()
-                db.refresh(content)
+                await db.commit()
+                await db.refresh(content)
         case JobKind.DECRYPT:
             if job_result.status == "finished":
                 content.availability = ContentAvailability.INSTANT
-                db.commit()
-                db.refresh(content)
+                await db.commit()
+                await db.refresh(content)
 
-    db.commit()
-    db.refresh(job)
+    await db.commit()
+    await db.refresh(job)
     return job
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, status
 from fastapi.exceptions import HTTPException
 from fastapi.responses import RedirectResponse
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from storage.db.models import Content, Permission, User
-from storage.db.session import SessionLocal
 from storage.logging import log
 from storage.schemas import permission as schemas
 from storage.web import deps
@@ -14,7 +15,7 @@ router = APIRouter()
 @router.get("/", response_model=list[schemas.Permission])
 async def read_permissions(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
 ):
     """Read permissions where the user is an owner of a content or a permission
@@ -24,15 +25,18 @@ async def read_permissions(
     log.debug(f"read_permissions, {current_user=}")
     # ToDo: optimize queries with eager relationships loading and joins
     permissions_assigned: list[Permission] = (
-        db.query(Permission).filter(Permission.assignee_id == current_user.id).all()
-    )
-    contents: list[Content] = (
-        db.query(Content.id).filter(Content.owner_id == current_user.id).all()
-    )
-    contents_ids: list[int] = [content.id for content in contents]
-    permissions_issued: list[Permission] = db.query(Permission).filter(
-        Permission.content_id.in_(contents_ids)
-    )
+        await db.scalars(
+            select(Permission).filter(Permission.assignee_id == current_user.id)
+        )
+    ).all()
+    contents_ids: list[int] = (
+        await db.scalars(select(Content.id).filter(Content.owner_id == current_user.id))
+    ).all()
+    permissions_issued: list[Permission] = (
+        await db.scalars(
+            select(Permission).filter(Permission.content_id.in_(contents_ids))
+        )
+    ).all()
     return [*permissions_issued, *permissions_assigned]
 
 
@@ -52,7 +56,7 @@ async def read_permissions(
 )
 async def create_permission(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
     permission_in: schemas.PermissionCreate,
 ):
@@ -62,16 +66,14 @@ async def create_permission(
     """
 
     log.debug(f"create_permission, {permission_in=}, {current_user.id=}")
-    assignee_exists: bool = db.query(
-        db.query(User).filter(User.id == permission_in.assignee_id).exists()
-    ).scalar()
+    assignee_exists: bool = await db.scalar(
+        select(exists().where(User.id == permission_in.assignee_id))
+    )
     if not assignee_exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Assignee user not found"
         )
-    content: Content | None = (
-        db.query(Content).filter(Content.id == permission_in.content_id).first()
-    )
+    content: Content | None = await db.get(Content, permission_in.content_id)
     if not content:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Content not found"
@@ -80,14 +82,12 @@ async def create_permission(
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
         )
-    permission_id: int | None = (
-        db.query(Permission.id)
-        .filter(
+    permission_id: int | None = await db.scalar(
+        select(Permission.id).filter(
             Permission.assignee_id == permission_in.assignee_id,
             Permission.content_id == permission_in.content_id,
             Permission.kind == permission_in.kind,
         )
-        .scalar()
     )
     if permission_id:
         return RedirectResponse(
@@ -101,8 +101,8 @@ async def create_permission(
     )
     # ToDo: what if the content or assignee deleted while querying?
     db.add(permission)
-    db.commit()
-    db.refresh(permission)
+    await db.commit()
+    await db.refresh(permission)
     return permission
 
 
@@ -113,7 +113,7 @@ async def create_permission(
 )
 async def read_permission_by_id(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
     permission_id: int,
 ):
@@ -123,16 +123,12 @@ async def read_permission_by_id(
 
     log.debug(f"read_permission_by_id, {permission_id=}, {current_user.id=}")
     # ToDo: optimize query for content owner check
-    permission: Permission | None = (
-        db.query(Permission).filter(Permission.id == permission_id).first()
-    )
+    permission: Permission | None = await db.get(Permission, permission_id)
     if not permission:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Permission not found"
         )
-    content: Content = (
-        db.query(Content).filter(Content.id == permission.content_id).first()
-    )
+    content: Content = await db.get(Content, permission.content_id)
     # ToDo: what if permission or content deleted?
     if (
         current_user.id != content.owner_id
@@ -153,25 +149,21 @@ async def read_permission_by_id(
 )
 async def delete_permission(
     *,
-    db: SessionLocal = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_user: User = Depends(deps.get_current_user),
     permission_id: int,
 ):
     log.debug(f"delete_permission, {permission_id=}, {current_user.id=}")
-    permission: Permission | None = (
-        db.query(Permission).filter(Permission.id == permission_id).first()
-    )
+    permission: Permission | None = await db.get(Permission, permission_id)
     if not permission:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Permission not found"
         )
-    content: Content = (
-        db.query(Content).filter(Content.id == permission.content_id).first()
-    )
+    content: Content = await db.get(Content, permission.content_id)
     if current_user.id != content.owner_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
         )
-    db.delete(permission)
-    db.commit()
+    await db.delete(permission)
+    await db.commit()
     return permission
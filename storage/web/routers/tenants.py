@@ -1,7 +1,10 @@
 from fastapi import APIRouter, Depends, status
 from fastapi.exceptions import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from storage.db.models.tenant import Tenant
+from storage.db.multitenancy import tenant_registry
 from storage.logging import log
 from storage.schemas import tenant as schemas
 from storage.web import deps
@@ -12,16 +15,16 @@ router = APIRouter()
 @router.get("/", response_model=list[schemas.Tenant])
 async def read_tenants(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
 ):
     log.debug("read_tenants")
-    tenants = db.query(Tenant).all()
+    tenants = (await db.scalars(select(Tenant))).all()
     return tenants
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.Tenant)
 async def create_tenant(
-    *, db: dict = Depends(deps.get_db), tenant_in: schemas.TenantCreate
+    *, db: AsyncSession = Depends(deps.get_async_db), tenant_in: schemas.TenantCreate
 ):
     log.debug(f"create_tenant, {tenant_in=}")
     # ToDo: does not keep invariants, check storage.db.multitenancy.tenant_create
@@ -31,15 +34,18 @@ async def create_tenant(
         host=tenant_in.name,
     )
     db.add(tenant)
-    db.commit()
-    db.refresh(tenant)
+    await db.commit()
+    await db.refresh(tenant)
+    tenant_registry.invalidate(tenant.host)
     return tenant
 
 
 @router.get("/{tenant_id}", response_model=schemas.Tenant)
-async def read_tenant_by_id(*, db: dict = Depends(deps.get_db), tenant_id: int):
+async def read_tenant_by_id(
+    *, db: AsyncSession = Depends(deps.get_async_db), tenant_id: int
+):
     log.debug(f"read_tenant_by_id, {tenant_id=}")
-    tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+    tenant = await db.get(Tenant, tenant_id)
     if not tenant:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Tenant not found"
@@ -50,19 +56,22 @@ async def read_tenant_by_id(*, db: dict = Depends(deps.get_db), tenant_id: int):
 @router.put("/{tenant_id}", response_model=schemas.Tenant)
 async def update_tenant(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     tenant_in: schemas.TenantUpdate,
     tenant_id: int,
 ):
     log.debug(f"update_tenant, {tenant_id=}, {tenant_in=}")
-    tenant = db.query(Tenant).filter(Tenant.id == tenant_id).first()
+    tenant = await db.get(Tenant, tenant_id)
     if not tenant:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Tenant not found"
         )
     # ToDo: rename schema
+    old_host = tenant.host
     tenant.name = tenant_in.name
     tenant.host = tenant_in.name
-    db.commit()
-    db.refresh(tenant)
+    await db.commit()
+    await db.refresh(tenant)
+    tenant_registry.invalidate(old_host)
+    tenant_registry.invalidate(tenant.host)
     return tenant
@@ -2,18 +2,28 @@ from datetime import datetime, timezone
 
 from fastapi import APIRouter, Depends, status
 from fastapi.exceptions import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from storage.db.models import Token, User
 from storage.db.models.tenant import Tenant
 from storage.logging import log
 from storage.schemas import token as schemas
 from storage.web import deps
+from storage.web.credentials import revoked_tokens, verified_credentials
 from storage.web.deps import get_current_tenant
 from storage.web.security import create_access_token, create_api_key, get_api_key_hash
 
 router = APIRouter()
 
 
+def to_naive_utc(moment: datetime | None) -> datetime | None:
+    # the column is a timestamp without time zone, asyncpg doesn't convert
+    # aware datetimes to it
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
 @router.post(
     "/",
     status_code=status.HTTP_201_CREATED,
@@ -23,28 +33,31 @@ router = APIRouter()
 )
 async def create_token(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_tenant: Tenant = Depends(get_current_tenant),
     token_in: schemas.TokenCreate,
 ):
     """Create access token for a given user."""
 
     log.debug(f"create_token, {token_in=}, {current_tenant.id=}")
-    user = db.query(User).filter(User.id == token_in.owner_id).first()
+    user = await db.get(User, token_in.owner_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
+    # the key isn't handed out, signed access tokens don't carry it
     api_key = create_api_key()
     token = Token(
         hashed_token=get_api_key_hash(api_key),
-        expiry=token_in.expiry,
+        expiry=to_naive_utc(token_in.expiry),
         owner_id=token_in.owner_id,
     )
     db.add(token)
-    db.commit()
-    db.refresh(token)
-    access_token = create_access_token(token.id, api_key)
+    await db.commit()
+    await db.refresh(token)
+    access_token = create_access_token(
+        current_tenant.schema, token.owner_id, token.id, token.expiry
+    )
     return {"plain_token": access_token, **token.__dict__}
 
 
@@ -59,14 +72,14 @@ async def create_token(
 )
 async def update_token_expiry(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_tenant: Tenant = Depends(get_current_tenant),
     token_update: schemas.TokenUpdateExpiry,
 ):
     """Update token expiry. Must be in future, but not exceed current expiry value."""
 
     log.debug(f"create_token, {token_update=}, {current_tenant.id=}")
-    token: Token | None = db.query(Token).filter(Token.id == token_update.id).first()
+    token: Token | None = await db.get(Token, token_update.id)
     if not token:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Token not found"
@@ -83,7 +96,16 @@ async def update_token_expiry(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="Can't set expiry to the moment in the past",
         )
-    token.expiry = token_update.expiry
-    db.commit()
-    db.refresh(token)
+    expiry = to_naive_utc(token_update.expiry)
+    revoked_tokens.revoke(
+        db,
+        current_tenant.schema,
+        token.id,
+        revoked_after=expiry,
+        token_expiry=token.expiry,
+    )
+    token.expiry = expiry
+    await db.commit()
+    await db.refresh(token)
+    verified_credentials.invalidate(current_tenant.schema, token.id)
     return token
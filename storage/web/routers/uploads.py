@@ -0,0 +1,291 @@
+import asyncio
+import uuid
+
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Depends, Header, Request, status
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from storage.config import settings
+from storage.db.models import Content, Upload, User
+from storage.db.models.content import ContentAvailability
+from storage.db.models.tenant import Tenant
+from storage.logging import log
+from storage.schemas import content as content_schemas
+from storage.schemas import upload as schemas
+from storage.services.instant_storage import (
+    MULTIPART_MIN_PART_SIZE,
+    complete_multipart_upload,
+    start_multipart_upload,
+    upload_multipart_part,
+)
+from storage.services.usage import record_usage
+from storage.unixfs import CHUNK_SIZE, UnixFSHasher
+from storage.upload import discard_upload, promote, upload_expiry
+from storage.web import deps
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+router = APIRouter()
+
+
+async def get_upload_for_update(db: AsyncSession, upload_id: int, user: User) -> Upload:
+    try:
+        upload: Upload | None = await db.scalar(
+            select(Upload)
+            .filter(Upload.id == upload_id, Upload.owner_id == user.id)
+            .with_for_update(nowait=True)
+        )
+    except DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE:
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Upload is busy"
+        )
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found"
+        )
+    return upload
+
+
+@router.post(
+    "/",
+    status_code=status.HTTP_201_CREATED,
+    response_description="Created",
+    response_model=schemas.Upload,
+)
+async def create_upload(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_user),
+    upload_in: schemas.UploadCreate,
+):
+    """Start a resumable upload of a file of the given size."""
+
+    log.debug(f"create_upload, {upload_in=}, {current_user.id=}")
+    key = f"uploads/{uuid.uuid4()}"
+    upload = Upload(
+        filename=upload_in.filename,
+        size=upload_in.size,
+        offset=0,
+        key=key,
+        upload_id=await start_multipart_upload(key),
+        etags=[],
+        hasher_state=UnixFSHasher().get_state(),
+        owner_id=current_user.id,
+        expires_at=upload_expiry(),
+    )
+    db.add(upload)
+    await db.commit()
+    await db.refresh(upload)
+    return upload
+
+
+@router.get(
+    "/{upload_id}",
+    response_model=schemas.Upload,
+    responses={status.HTTP_404_NOT_FOUND: {"description": "Not Found"}},
+)
+async def read_upload_by_id(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_user),
+    upload_id: int,
+):
+    """Read an upload in progress, its offset is where the next chunk starts."""
+
+    log.debug(f"read_upload_by_id, {upload_id=}, {current_user.id=}")
+    upload: Upload | None = await db.scalar(
+        select(Upload).filter(
+            Upload.id == upload_id, Upload.owner_id == current_user.id
+        )
+    )
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found"
+        )
+    return upload
+
+
+@router.patch(
+    "/{upload_id}",
+    response_model=schemas.Upload,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"description": "Bad chunk size"},
+        status.HTTP_404_NOT_FOUND: {"description": "Not Found"},
+        status.HTTP_409_CONFLICT: {"description": "Offset mismatch"},
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"description": "Too large"},
+    },
+)
+async def upload_chunk(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_user),
+    upload_id: int,
+    upload_offset: int = Header(alias="Upload-Offset"),
+    request: Request,
+):
+    """Append a chunk sent as a request body at the given offset. Every chunk but
+    the last one must be a multiple of 256KiB and at least 5MiB.
+    """
+
+    log.debug(f"upload_chunk, {upload_id=}, {upload_offset=}, {current_user.id=}")
+    upload: Upload | None = await db.scalar(
+        select(Upload).filter(
+            Upload.id == upload_id, Upload.owner_id == current_user.id
+        )
+    )
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found"
+        )
+    if upload.completing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Upload is completing"
+        )
+    if upload_offset != upload.offset:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Offset mismatch, expected {upload.offset}",
+        )
+    key, multipart_upload_id, size = upload.key, upload.upload_id, upload.size
+    part_number = len(upload.etags) + 1
+    hasher = UnixFSHasher.from_state(upload.hasher_state)
+    # neither a connection nor the row lock is held while the chunk is received
+    # and stored, the upload is locked only to record it
+    await db.rollback()
+
+    chunk = bytearray()
+    async for data in request.stream():
+        chunk += data
+        if (
+            len(chunk) > settings.UPLOAD_MAX_CHUNK_SIZE
+            or upload_offset + len(chunk) > size
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Chunk is too large",
+            )
+    chunk = bytes(chunk)
+    end = upload_offset + len(chunk)
+    if not chunk or (
+        end < size and (len(chunk) < MULTIPART_MIN_PART_SIZE or len(chunk) % CHUNK_SIZE)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Bad chunk size"
+        )
+
+    etag, _ = await asyncio.gather(
+        upload_multipart_part(key, multipart_upload_id, part_number, chunk),
+        asyncio.to_thread(hasher.update, chunk),
+    )
+    if end < size:
+        hasher_state = hasher.get_state()
+    else:
+        hasher_state = {"digest": await asyncio.to_thread(hasher.digest)}
+
+    upload = await get_upload_for_update(db, upload_id, current_user)
+    if upload.offset != upload_offset:
+        # a chunk at the same offset was recorded meanwhile, under the same part
+        # number, so the part kept by the storage fails completion unless equal
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Offset mismatch, expected {upload.offset}",
+        )
+    upload.hasher_state = hasher_state
+    upload.etags = [*upload.etags, etag]
+    upload.offset = end
+    upload.expires_at = upload_expiry()
+    await db.commit()
+    await db.refresh(upload)
+    return upload
+
+
+@router.post(
+    "/{upload_id}/complete",
+    status_code=status.HTTP_201_CREATED,
+    response_description="Created",
+    response_model=content_schemas.Content,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Not Found"},
+        status.HTTP_409_CONFLICT: {"description": "Incomplete"},
+    },
+)
+async def complete_upload(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_user),
+    tenant: Tenant = Depends(deps.get_tenant),
+    upload_id: int,
+):
+    """Finish an upload with all the chunks received, creating content of it."""
+
+    log.debug(f"complete_upload, {upload_id=}, {current_user.id=}")
+    upload = await get_upload_for_update(db, upload_id, current_user)
+    if upload.offset != upload.size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="Upload is incomplete"
+        )
+    if "digest" not in upload.hasher_state:
+        upload.hasher_state = {
+            "digest": UnixFSHasher.from_state(upload.hasher_state).digest()
+        }
+    ipfs_cid, ipfs_file_size = upload.hasher_state["digest"]
+    key, multipart_upload_id, etags = upload.key, upload.upload_id, upload.etags
+    size = upload.size
+    # no more chunks are accepted, and neither the row lock nor a connection is
+    # held while the object is assembled and copied under its CID, which takes
+    # minutes for large ones. A failed completion is retried from here
+    upload.completing = True
+    upload.expires_at = upload_expiry()
+    await db.commit()
+
+    try:
+        await complete_multipart_upload(key, multipart_upload_id, etags)
+    except ClientError as e:
+        # completed by an earlier attempt
+        if e.response["Error"]["Code"] != "NoSuchUpload":
+            raise
+    await promote(key, ipfs_cid, size)
+
+    upload = await get_upload_for_update(db, upload_id, current_user)
+    content = Content(
+        filename=upload.filename,
+        ipfs_cid=ipfs_cid,
+        ipfs_file_size=ipfs_file_size,
+        availability=ContentAvailability.INSTANT,
+        is_instant=True,
+        owner_id=current_user.id,
+    )
+    db.add(content)
+    await db.delete(upload)
+    await record_usage(db, tenant.schema, current_user.id, 1, ipfs_file_size)
+    await db.commit()
+    await db.refresh(content)
+    return content
+
+
+@router.delete(
+    "/{upload_id}",
+    response_model=schemas.Upload,
+    status_code=status.HTTP_200_OK,
+    response_description="Deleted",
+    responses={status.HTTP_404_NOT_FOUND: {"description": "Not Found"}},
+)
+async def delete_upload(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_user),
+    upload_id: int,
+):
+    """Cancel an upload, dropping the chunks received."""
+
+    log.debug(f"delete_upload, {upload_id=}, {current_user.id=}")
+    upload = await get_upload_for_update(db, upload_id, current_user)
+    await discard_upload(upload.key, upload.upload_id)
+    await db.delete(upload)
+    await db.commit()
+    return upload
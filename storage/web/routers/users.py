@@ -1,11 +1,16 @@
+from datetime import datetime
+
 from fastapi import APIRouter, Depends, status
 from fastapi.exceptions import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from storage.db.models import User
+from storage.db.models import Token, User
 from storage.db.models.tenant import Tenant
 from storage.logging import log
 from storage.schemas import user as schemas
 from storage.web import deps
+from storage.web.credentials import revoked_tokens, verified_credentials
 from storage.web.deps import get_current_tenant
 
 router = APIRouter()
@@ -14,11 +19,11 @@ router = APIRouter()
 @router.get("/", response_model=list[schemas.User])
 async def read_users(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     current_tenant: Tenant = Depends(get_current_tenant),
 ):
     log.info(f"read_users, {current_tenant.id=}")
-    users = db.query(User).all()
+    users = (await db.scalars(select(User))).all()
     return users
 
 
@@ -30,15 +35,15 @@ async def read_users(
 )
 async def create_user(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     user_in: schemas.UserCreate,
     current_tenant: Tenant = Depends(get_current_tenant),
 ):
     log.debug(f"create_user, {user_in=}, {current_tenant.id=}")
     user = User()
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     return user
 
 
@@ -51,12 +56,12 @@ async def create_user(
 )
 async def read_user_by_id(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     user_id: int,
     current_tenant: Tenant = Depends(get_current_tenant),
 ):
     log.debug(f"read_user_by_id, {user_id=}, {current_tenant.id=}")
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -73,16 +78,33 @@ async def read_user_by_id(
 )
 async def delete_user(
     *,
-    db: dict = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_async_db),
     user_id: int,
     current_tenant: Tenant = Depends(get_current_tenant),
 ):
     log.debug(f"delete_user, {user_id=}, {db=}, {current_tenant.id=}")
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
-    db.delete(user)
-    db.commit()
+    tokens = (
+        await db.execute(
+            select(Token.id, Token.expiry).filter(Token.owner_id == user.id)
+        )
+    ).all()
+    # signed access tokens are verified without a lookup, they're denied instead
+    revoked_after = datetime.utcnow()
+    for token in tokens:
+        revoked_tokens.revoke(
+            db,
+            current_tenant.schema,
+            token.id,
+            revoked_after=revoked_after,
+            token_expiry=token.expiry,
+        )
+    await db.delete(user)
+    await db.commit()
+    for token in tokens:
+        verified_credentials.invalidate(current_tenant.schema, token.id)
     return user
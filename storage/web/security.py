@@ -1,32 +1,157 @@
+import asyncio
+import hashlib
+import hmac
 import json
 import secrets
+import threading
 from base64 import urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import NamedTuple
 
 from passlib.context import CryptContext
 
+from storage import metrics
+from storage.config import settings
+
+# API keys are random 64 byte values, so a keyed digest is enough to store them
+# and can be looked up by. Keys created earlier are bcrypt hashed, such hashes
+# are replaced with digests once the keys are verified.
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# legacy access tokens are base64 encoded JSON objects, they never contain dots
+SIGNED_ACCESS_TOKEN_PREFIX = "v1."
+
+
+class AccessTokenClaims(NamedTuple):
+    tenant_schema: str
+    user_id: int
+    token_id: int
+    expiry: int | None  # unix time
+
+
+class HashingExecutor:
+    """Bounded thread pool for bcrypt. bcrypt releases the GIL, so verifications
+    run in parallel without blocking the event loop or taking the threads
+    shared with the rest of the requests.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hashing"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of calls waiting for a free thread."""
+
+        return self._queued
+
+    def _call(self, fn, args):
+        with self._lock:
+            self._queued -= 1
+        return fn(*args)
+
+    async def run(self, fn, *args):
+        with self._lock:
+            self._queued += 1
+        future = self._executor.submit(self._call, fn, args)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancel():  # never started
+                with self._lock:
+                    self._queued -= 1
+            raise
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+hashing_executor = HashingExecutor(settings.API_KEY_HASHING_THREADS)
+metrics.register_gauge(
+    "storage_api_key_hashing_queue_depth",
+    "API key verifications waiting for a hashing thread.",
+    lambda: hashing_executor.queue_depth,
+)
+
 
 def create_api_key():
     return secrets.token_urlsafe(64)
 
 
+def is_legacy_api_key_hash(hashed_api_key: str) -> bool:
+    return pwd_context.identify(hashed_api_key) is not None
+
+
 def verify_api_key(plain_api_key, hashed_api_key):
-    return pwd_context.verify(plain_api_key, hashed_api_key)
+    if is_legacy_api_key_hash(hashed_api_key):
+        return pwd_context.verify(plain_api_key, hashed_api_key)
+    return hmac.compare_digest(get_api_key_hash(plain_api_key), hashed_api_key)
+
+
+async def verify_api_key_async(plain_api_key, hashed_api_key):
+    if is_legacy_api_key_hash(hashed_api_key):
+        return await hashing_executor.run(
+            pwd_context.verify, plain_api_key, hashed_api_key
+        )
+    # a digest is cheaper to compare than to hand over to a thread
+    return verify_api_key(plain_api_key, hashed_api_key)
 
 
 def get_api_key_hash(api_key: str):
-    return pwd_context.hash(api_key)
+    return hmac.new(
+        settings.API_KEY_HMAC_SECRET.encode(), api_key.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def _sign(message: bytes) -> bytes:
+    digest = hmac.new(
+        settings.ACCESS_TOKEN_SIGNING_SECRET.encode(), message, hashlib.sha256
+    ).digest()
+    return urlsafe_b64encode(digest).rstrip(b"=")
+
 
+def create_access_token(
+    tenant_schema: str, user_id: int, token_id: int, expiry: datetime | None
+) -> str:
+    """Create an access token signed with `ACCESS_TOKEN_SIGNING_SECRET`, so it's
+    verified without a token lookup. Naive expiry is taken as UTC, like stored.
+    """
 
-def create_access_token(token_id: int, api_key: str):
-    data = {"id": token_id, "val": api_key}
-    payload = json.dumps(data).encode("utf-8")
-    token = urlsafe_b64encode(payload)
-    return token
+    if expiry is not None and expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    data = {
+        "t": tenant_schema,
+        "u": user_id,
+        "id": token_id,
+        "exp": int(expiry.timestamp()) if expiry is not None else None,
+    }
+    payload = urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode())
+    message = SIGNED_ACCESS_TOKEN_PREFIX.encode() + payload.rstrip(b"=")
+    return (message + b"." + _sign(message)).decode()
+
+
+def is_signed_access_token(token: str) -> bool:
+    return token.startswith(SIGNED_ACCESS_TOKEN_PREFIX)
+
+
+def decode_signed_access_token(token: str) -> AccessTokenClaims | None:
+    """Get claims of the access token, or None if the signature doesn't match."""
+
+    message, _, signature = token.encode().rpartition(b".")
+    if not hmac.compare_digest(_sign(message), signature):
+        return None
+    payload = message[len(SIGNED_ACCESS_TOKEN_PREFIX) :]
+    data = json.loads(urlsafe_b64decode(payload + b"=" * (-len(payload) % 4)))
+    return AccessTokenClaims(data["t"], data["u"], data["id"], data["exp"])
 
 
 def decode_access_token(token: str):
+    """Decode a legacy access token, the plain API key encoded with the token id."""
+
     payload = urlsafe_b64decode(token)
     data = json.loads(payload.decode("utf-8"))
     return data["id"], data["val"]
@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+from storage.config import settings
+from storage.db.session import MeasuredQueuePool, _checking_out_for
+
+MAX_CONNECTIONS = 2
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(settings, "DB_TENANT_MAX_CONNECTIONS", MAX_CONNECTIONS)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT", 0.1)
+    engine = create_engine("sqlite://", poolclass=MeasuredQueuePool, pool_recycle=60)
+    yield engine
+    engine.dispose()
+
+
+def assert_tenant_slots_free(engine, tenant_schema: str):
+    with _checking_out_for(tenant_schema):
+        connections = [engine.connect() for _ in range(MAX_CONNECTIONS)]
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        for connection in connections:
+            connection.close()
+
+
+def test_tenant_connections_capped(engine):
+    with _checking_out_for("t1"):
+        connections = [engine.connect() for _ in range(MAX_CONNECTIONS)]
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    # other tenants and sessions without one aren't affected
+    with _checking_out_for("t2"):
+        engine.connect().close()
+    engine.connect().close()
+    for connection in connections:
+        connection.close()
+    assert_tenant_slots_free(engine, "t1")
+
+
+def test_tenant_slots_released_after_recycle(engine):
+    with _checking_out_for("t1"):
+        for _ in range(MAX_CONNECTIONS + 1):
+            with engine.connect() as connection:
+                # recycled on its next checkout
+                connection.connection._connection_record.starttime -= 120
+    assert_tenant_slots_free(engine, "t1")
+
+
+def test_tenant_slots_released_after_invalidation(engine):
+    with _checking_out_for("t1"):
+        for _ in range(MAX_CONNECTIONS + 1):
+            with engine.connect() as connection:
+                connection.invalidate()
+    assert_tenant_slots_free(engine, "t1")
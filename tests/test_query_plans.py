@@ -0,0 +1,31 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from storage.db.models.tenant import Tenant
+from storage.db.multitenancy import get_tenant_specific_metadata
+from storage.db.query_plans import hot_queries, seq_scans
+from storage.db.session import engine, with_db
+
+TENANT_TABLES = {table.name for table in get_tenant_specific_metadata().tables.values()}
+
+
+@pytest.fixture(scope="module")
+def tenant_schemas() -> list[str]:
+    try:
+        engine.connect().close()
+    except OperationalError:
+        pytest.skip("no database")
+    with with_db() as db:
+        schemas = db.scalars(select(Tenant.schema)).all()
+    if not schemas:
+        pytest.skip("no tenants")
+    return schemas
+
+
+@pytest.mark.parametrize("name", hot_queries())
+def test_hot_query_plan(tenant_schemas, name):
+    for schema in tenant_schemas:
+        with with_db(schema) as db:
+            scans = seq_scans(db, hot_queries()[name])
+        assert not TENANT_TABLES.intersection(scans), f"{schema=}, {scans=}"
@@ -0,0 +1,74 @@
+import hashlib
+import random
+
+import pytest
+
+from storage.unixfs import CHUNK_SIZE, MAX_LINKS, UnixFSHasher, compute_cid
+
+# Root CIDs and DAG sizes of `ipfs add --cid-version=1` of kubo v0.22.0 for
+# `_data(size)`.
+CASES = {
+    "empty": (
+        0,
+        "bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku",
+        0,
+    ),
+    "single chunk": (
+        1000,
+        "bafkreidkrbuvbqj6h425krc5g4azmx6kia6lltf4wtrtdrnpexxk722vq4",
+        1000,
+    ),
+    "chunk boundary": (
+        CHUNK_SIZE,
+        "bafkreifcewkcw5amqx5hxmu5rcyx4herrcc5duo3hbyzt5ubu53igdg36a",
+        262144,
+    ),
+    "multiple chunks": (
+        3 * CHUNK_SIZE + 1000,
+        "bafybeih2i5h6i6obosrc2t4zaq6orom2wtk4rjaukwymww6kggxovfcd5a",
+        787638,
+    ),
+    "full node": (
+        MAX_LINKS * CHUNK_SIZE,
+        "bafybeiagkjm6fs24zcvnegiq67uew26hfssytf5ca4yz5kmpuyfmxkmace",
+        45621766,
+    ),
+    "past fanout": (
+        MAX_LINKS * CHUNK_SIZE + 1,
+        "bafybeidw5ahoxmgw2vdis2g2nzt57nny7ycrotoi2fxyamrbebwtv57wha",
+        45621926,
+    ),
+}
+
+
+def _data(size: int) -> bytes:
+    return hashlib.shake_256(b"unixfs").digest(size)
+
+
+@pytest.mark.parametrize("size,cid,dag_size", CASES.values(), ids=CASES.keys())
+def test_compute_cid(size, cid, dag_size):
+    assert compute_cid(_data(size)) == (cid, dag_size)
+
+
+@pytest.mark.parametrize("size,cid,dag_size", CASES.values(), ids=CASES.keys())
+def test_split_feeds(size, cid, dag_size):
+    data = _data(size)
+    rng = random.Random(size)
+    hasher = UnixFSHasher()
+    offset = 0
+    while offset < len(data):
+        step = rng.choice([1, 7, 4096, CHUNK_SIZE - 1, CHUNK_SIZE + 1, 3 * CHUNK_SIZE])
+        hasher.update(data[offset : offset + step])
+        offset += step
+    hasher.update(b"")
+    assert hasher.digest() == (cid, dag_size)
+
+
+def test_resume_from_state():
+    size, cid, dag_size = CASES["past fanout"]
+    data = _data(size)
+    hasher = UnixFSHasher()
+    hasher.update(data[: 100 * CHUNK_SIZE])
+    hasher = UnixFSHasher.from_state(hasher.get_state())
+    hasher.update(data[100 * CHUNK_SIZE :])
+    assert hasher.digest() == (cid, dag_size)